@@ -24,19 +24,22 @@
 
 import random
 import argparse
+import math
 import sys
 import xml.etree.ElementTree as xtree
 
 __author__  = 'Christian Rosentreter'
 __version__ = '1.2'
-__all__     = ['USquare']
+__all__     = ['USquare', 'parse_arguments', 'generate_data', 'generate', 'geometry_parameters', 'estimate_cost']
+
+STYLE_OPTIONS = ('negative', 'separate_paths', 'output', 'output_size', 'export', 'geometry_cache', 'dry_run', 'max_elements', 'max_seconds', 'max_output_bytes')  # no influence on the generated data
 
 
 
 class USquare():
 	"""SVG description for a square 'U' shape, optionally rotated by 90° and/ or flipped."""
 
-	dmod = {'n':['h', 'v', 1], 'e':['v', 'h', 1], 'w':['v', 'h', -1], 's':['h', 'v', -1]}
+	dmod = {'n':('h', 'v', 1), 'e':('v', 'h', 1), 'w':('v', 'h', -1), 's':('h', 'v', -1)}
 
 	def __init__(self, x, y, scale=1.0, direction='n', variation=0.0):
 		self.x         = x
@@ -64,8 +67,20 @@ class USquare():
 		])
 
 
-def main():
-	"""Let's make a work of art."""
+def grid_region(text):
+	"""Converts a 'FIRST:LAST,FIRST:LAST' specification of grid columns and rows (zero based, all inclusive) into two ranges."""
+	try:
+		columns, rows = ([int(v) for v in span.split(':')] for span in text.split(','))
+		(c1, c2), (r1, r2) = columns, rows
+	except ValueError:
+		raise argparse.ArgumentTypeError('invalid region "{}"; expected FIRST:LAST,FIRST:LAST'.format(text)) from None
+	if (c1 < 0) or (r1 < 0) or (c2 < c1) or (r2 < r1):
+		raise argparse.ArgumentTypeError('invalid region "{}"; LAST is smaller than FIRST or an index is negative'.format(text))
+	return range(c1, c2 + 1), range(r1, r2 + 1)
+
+
+def parse_arguments(args=None):
+	"""Sets up the command line interface and parses the supplied arguments."""
 
 	ap = argparse.ArgumentParser(
 		description=('Implements an artful grid-based layout of "U"-shapes; inspired '
@@ -86,6 +101,7 @@ def main():
 	g.add_argument('--shape-variation', metavar='FLOAT',    type=float, help='variation factor for the shape\'s inner "cut out" area  [:1.0]', default=1.0)
 	g.add_argument('--offset-jiggle',   metavar='FLOAT',    type=float, help='randomizing factor for horizontal and vertical shifts of the element\'s coordinates  [:2.0]', default=2.0)
 	g.add_argument('--random-seed',     metavar='INT',      type=int,   help='fixed initialization of the random number generator for predictable results')
+	g.add_argument('--no-overlap',      action='store_true',            help='move elements that would overlap others because of their offset jiggle; the number of moved elements is reported on the standard error stream')
 
 	g = ap.add_argument_group('Miscellaneous')
 	g.add_argument('--separate-paths',  action='store_true',            help='generate separate <path> elements for each element')
@@ -94,10 +110,149 @@ def main():
 
 	g = ap.add_argument_group('Output')
 	g.add_argument('-o', '--output',    metavar='FILENAME', type=str,   help='optionally rasterize the generated vector paths and write the result into a PNG file (requires the `svgcairo\' Python module)')
-	g.add_argument('--output-size',     metavar='INT',      type=int,   help='force pixel width of the raster image, height is automatically calculated; if omitted the generated SVG viewbox dimensions are used')
-
-	user_input  = ap.parse_args()
-
+	g.add_argument('--output-size',     metavar='INT',      type=int,   nargs='+', help='force pixel width of the raster image, height is automatically calculated; if omitted the generated SVG viewbox dimensions are used; passing several sizes writes one PNG file for each, the `{size}\' placeholder in the filename is replaced with the size (else it is appended to the filename)')
+	g.add_argument('--preview',         metavar='INT',      type=int,   nargs='?', const=24, help='quickly generate just the top left corner of INT×INT grid cells, laid out exactly as in the full artwork  [:24]')
+	g.add_argument('--region',          metavar='FIRST:LAST,FIRST:LAST', type=grid_region, help='generate just the grid cells of the given ranges of columns and rows (zero based, inclusive), laid out exactly as in the full artwork and with a matching viewbox; f.ex. to compose crops of huge grids')
+	g.add_argument('--export',          metavar='FILENAME', type=str,   help='write the generated shape data as typed columnar arrays into a binary file instead of printing SVG output')
+	g.add_argument('--geometry-cache',  metavar='DIR',      type=str,   help='reuse the generated layout of earlier runs with the same random seed and algorithm parameters from a cache directory, so changes of style only options are applied without generating everything again; requires --random-seed')
+
+	from macuahuitl import add_limit_arguments
+	add_limit_arguments(ap)
+
+	return ap.parse_args(args)
+
+
+def geometry_parameters(user_input):
+	"""Returns the parts of the parsed user input with influence on the generated data, f.ex. to use as cache key."""
+	parameters = {k:v for k, v in vars(user_input).items() if k not in STYLE_OPTIONS}
+	if user_input.region:
+		parameters['region'] = [[span.start, span.stop - 1] for span in user_input.region]
+	parameters['version'] = __version__
+	return parameters
+
+
+def view_ranges(user_input):
+	"""Returns the ranges of grid columns and rows to generate, based on the region and preview options."""
+	view_x = range(0, max(0, user_input.columns))
+	view_y = range(0, max(0, user_input.rows))
+	if user_input.region:
+		view_x = view_x[user_input.region[0].start:user_input.region[0].stop]
+		view_y = view_y[user_input.region[1].start:user_input.region[1].stop]
+	if user_input.preview:
+		view_x = view_x[:user_input.preview]
+		view_y = view_y[:user_input.preview]
+	return view_x, view_y
+
+
+def skip_cells(chaos, count):
+	"""Advances the random number generator past grid cells exactly as generating them would, just cheaper.
+
+	A cell draws two coordinate jiggles, a direction, and a variation. Two calls of `random()' consume
+	as much of the generator's state as `getrandbits(128)', so the variation of one cell and the jiggles
+	of the next one are skipped with a single call; only `choice()' needs to be replayed as it is.
+	"""
+	if count > 0:
+		chaos.getrandbits(128)
+		for _ in range(count - 1):
+			chaos.choice('news')
+			chaos.getrandbits(192)
+		chaos.choice('news')
+		chaos.getrandbits(64)
+
+
+def place_cells(user_input, chaos, view_x, view_y, attempts=10):
+	"""Generates the grid elements of the given ranges of columns and rows without overlaps; returns them and the number of moved ones.
+
+	Elements are placed in generation order and checked against the ones placed before through a
+	spatial hash with buckets the size of an element, so just the 3×3 buckets around need to be looked
+	at. An element in conflict gets new offsets from a separate random generator (so all following
+	elements draw the same numbers as without this), and after a few attempts it's placed right at
+	its grid position. That fallback is always free, as elements are also kept off the grid positions
+	of the ones not placed yet. The columns in front of the region are placed as well, as they
+	influence its elements; the ones behind it only do so with their grid positions.
+	"""
+	grid_x      = user_input.columns
+	grid_y      = user_input.rows
+	grid_size   = user_input.scale
+	grid_offset = grid_size + user_input.gap
+	variation   = user_input.shape_variation
+	jiggle      = user_input.offset_jiggle
+	frame       = user_input.frame
+	fixer       = random.Random(None if user_input.random_seed is None else 'altepetl-no-overlap-{}'.format(user_input.random_seed))
+	buckets     = {}
+	squares     = []
+	moved       = 0
+
+	def _home(i):
+		return (i * grid_offset) + (grid_offset / 2.0) + frame
+
+	def _nearby(v):  # grid indices with positions closer than an element size
+		return range(max(0, math.ceil((v - grid_size - frame) / grid_offset - 0.5)), math.floor((v + grid_size - frame) / grid_offset - 0.5) + 1)
+
+	def _free(index, dx, dy):
+		if grid_size <= 0:
+			return True
+		bx, by = int(dx // grid_size), int(dy // grid_size)
+		for bucket in ((bx + i, by + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+			for ox, oy in buckets.get(bucket, ()):
+				if (abs(ox - dx) < grid_size) and (abs(oy - dy) < grid_size):
+					return False
+		for gx in _nearby(dx):
+			for gy in _nearby(dy):
+				if (gx < grid_x) and (gy < grid_y) and (gx * grid_y + gy > index) and (abs(_home(gx) - dx) < grid_size) and (abs(_home(gy) - dy) < grid_size):
+					return False
+		return True
+
+	for x in range(0, view_x.stop):
+		for y in range(0, grid_y):
+			dx = _home(x) + chaos.uniform(-jiggle, jiggle)
+			dy = _home(y) + chaos.uniform(-jiggle, jiggle)
+			direction, shape_variation = chaos.choice('news'), chaos.uniform(0.0, variation)
+
+			tries = 0
+			while not _free(x * grid_y + y, dx, dy):
+				tries += 1
+				if tries > attempts:
+					dx, dy = _home(x), _home(y)
+					break
+				dx = _home(x) + fixer.uniform(-jiggle, jiggle)
+				dy = _home(y) + fixer.uniform(-jiggle, jiggle)
+
+			if grid_size > 0:
+				buckets.setdefault((int(dx // grid_size), int(dy // grid_size)), []).append((dx, dy))
+			if (x in view_x) and (y in view_y):
+				squares.append(USquare(dx, dy, grid_size, direction, shape_variation))
+				moved += (tries > 0)
+
+	return squares, moved
+
+
+def estimate_cost(user_input):
+	"""Estimates the number of shape elements, run time, and output size for the parsed user input; nothing is generated.
+
+	Run time and size per grid element were measured with the default parameters.
+	"""
+	grid_x      = max(0, user_input.columns)
+	grid_y      = max(0, user_input.rows)
+	grid_offset = user_input.scale + user_input.gap
+	vbw         = max(1, int((grid_offset * grid_x) + (user_input.frame * 2.0)))
+	vbh         = max(1, int((grid_offset * grid_y) + (user_input.frame * 2.0)))
+	view_x, view_y = view_ranges(user_input)
+	cells          = len(view_x) * len(view_y)
+	skipped        = (view_x.stop * grid_y - cells) if cells else 0
+	placed         = (skipped + cells) if user_input.no_overlap else 0  # placed without overlaps, including skipped ones
+
+	svg_bytes = cells * (132 if user_input.separate_paths else 100)
+
+	return {
+		'elements':     cells + 2,
+		'seconds':      round(cells * (20e-6 if user_input.separate_paths else 14e-6) + skipped * 0.9e-6 + placed * 15e-6, 3),
+		'output_bytes': sum(w * max(1, int(w * vbh / vbw)) * 4 for w in (user_input.output_size or [vbw])) if user_input.output else int(svg_bytes),
+	}
+
+
+def generate_data(user_input):
+	"""Generates the grid elements from the parsed user input."""
 
 	grid_x      = user_input.columns
 	grid_y      = user_input.rows
@@ -109,25 +264,54 @@ def main():
 
 	chaos       = random.Random(user_input.random_seed)
 	grid_offset = grid_size + grid_gap
+
+	view_x, view_y = view_ranges(user_input)
+
+	# Cells outside of the region (or preview corner) just keep the random numbers in sync; columns
+	# right of it are not needed at all.
+	squares = []
+	moved   = 0
+	if view_x and view_y and user_input.no_overlap:
+		squares, moved = place_cells(user_input, chaos, view_x, view_y)
+	elif view_x and view_y:
+		skip_cells(chaos, view_x.start * grid_y)
+		for x in view_x:
+			skip_cells(chaos, view_y.start)
+			for y in view_y:
+				dx = (x * grid_offset) + (grid_offset / 2.0) + frame + chaos.uniform(-jiggle, jiggle)
+				dy = (y * grid_offset) + (grid_offset / 2.0) + frame + chaos.uniform(-jiggle, jiggle)
+				squares.append(USquare(dx, dy, grid_size, chaos.choice('news'), chaos.uniform(0.0, variation)))
+			skip_cells(chaos, grid_y - view_y.stop)
+
+	# The frame is only added on the outer sides of the grid.
+	vbx = (view_x.start * grid_offset + frame) if view_x.start else 0
+	vby = (view_y.start * grid_offset + frame) if view_y.start else 0
+	vbw = int((grid_offset * len(view_x)) + (frame * ((view_x.start == 0) + (view_x.stop == grid_x))))
+	vbh = int((grid_offset * len(view_y)) + (frame * ((view_y.start == 0) + (view_y.stop == grid_y))))
+
+	return {'squares':squares, 'moved':moved, 'vbx':vbx, 'vby':vby, 'vbw':vbw, 'vbh':vbh}
+
+
+def generate(user_input, data=None):
+	"""Generates the grid from the parsed user input, or from already generated data; returns the SVG root element and its viewbox size."""
+
+	if data is None:
+		data = generate_data(user_input)
+
+	squares     = data['squares']
+	vbx         = data['vbx']
+	vby         = data['vby']
+	vbw         = data['vbw']
+	vbh         = data['vbh']
 	col1, col2  = 'white', 'black'
 	if user_input.negative:
 		col1, col2 = col2, col1
 
-	squares = []
-	for x in range(0, grid_x):
-		for y in range(0, grid_y):
-			dx = (x * grid_offset) + (grid_offset / 2.0) + frame + chaos.uniform(-jiggle, jiggle)
-			dy = (y * grid_offset) + (grid_offset / 2.0) + frame + chaos.uniform(-jiggle, jiggle)
-			squares.append(USquare(dx, dy, grid_size, chaos.choice('news'), chaos.uniform(0.0, variation)))
-
-	vbw = int((grid_offset * grid_x) + (frame * 2.0))
-	vbh = int((grid_offset * grid_y) + (frame * 2.0))
-
-	svg = xtree.Element('svg', {'width':'100%', 'height':'100%', 'xmlns':'http://www.w3.org/2000/svg', 'viewBox':'0 0 {} {}'.format(vbw, vbh)})
+	svg = xtree.Element('svg', {'width':'100%', 'height':'100%', 'xmlns':'http://www.w3.org/2000/svg', 'viewBox':'{} {} {} {}'.format(vbx, vby, vbw, vbh)})
 	title = xtree.SubElement(svg, 'title')
 	title.text = 'An Altepetl Artwork'
 
-	xtree.SubElement(svg, 'rect', {'id':'background', 'x':'0', 'y':'0', 'width':str(vbw), 'height':str(vbh), 'fill':col1})
+	xtree.SubElement(svg, 'rect', {'id':'background', 'x':str(vbx), 'y':str(vby), 'width':str(vbw), 'height':str(vbh), 'fill':col1})
 	if user_input.separate_paths:
 		svg_g = xtree.SubElement(svg, 'g', {'id':'grid-of-us', 'stroke-width':'0', 'fill':col2})
 		for si, s in enumerate(squares):
@@ -135,24 +319,56 @@ def main():
 	else:
 		xtree.SubElement(svg, 'path', {'id':'grid-of-us', 'stroke-width':'0', 'fill':col2, 'd':''.join(str(s) for s in squares)})
 
-	rawxml = xtree.tostring(svg, encoding='unicode')
+	return svg, vbw, vbh
 
-	if not user_input.output:
-		print(rawxml)
-	else:
-		try:
-			import os
-			from cairosvg import svg2png
-			
-			w = vbw if user_input.output_size is None else user_input.output_size
-			
-			svg2png(bytestring=rawxml,
-				write_to=os.path.realpath(os.path.expanduser(user_input.output)),
-				output_width=int(w),
-				output_height=int(w * vbh / vbw)
-			)
-		except ImportError as e:
-			print('Couldn\'t rasterize nor write a PNG file. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+
+def main():
+	"""Let's make a work of art."""
+
+	user_input    = parse_arguments()
+
+	if user_input.region and not all(view_ranges(user_input)):
+		print('Error: The region (`--region\') lies outside of the {}×{} grid.'.format(user_input.columns, user_input.rows), file=sys.stderr)
+		sys.exit(1)
+	from macuahuitl import check_limits
+	check_limits(user_input, estimate_cost)
+
+	from macuahuitl import generated_data
+	data = generated_data('altepetl', user_input, geometry_parameters, generate_data)
+
+	if user_input.no_overlap:
+		if user_input.gap < 0:
+			print('Warning: Elements can\'t be placed without overlaps with a negative gap (`--gap\').', file=sys.stderr)
+		print('Moved {} of {} elements to avoid overlaps.'.format(data.get('moved', 0), len(data['squares'])), file=sys.stderr)
+
+	if user_input.export:
+		import os
+		from macuahuitl import write_columns
+		view_x, view_y = view_ranges(user_input)
+		write_columns(os.path.realpath(os.path.expanduser(user_input.export)), 'altepetl', [
+			('x',         'd', (s.x for s in data['squares'])),
+			('y',         'd', (s.y for s in data['squares'])),
+			('direction', 'B', ('news'.index(s.direction) for s in data['squares'])),
+			('variation', 'd', (s.variation for s in data['squares'])),
+		], {
+			'columns':    len(view_x),
+			'rows':       len(view_y),
+			'scale':      user_input.scale,
+			'directions': 'news',
+			'order':      'column-major',
+			'left':       data['vbx'],
+			'top':        data['vby'],
+			'width':      data['vbw'],
+			'height':     data['vbh'],
+		})
+		if not user_input.output:
+			return
+
+	svg, vbw, vbh = generate(user_input, data)
+	rawxml        = xtree.tostring(svg, encoding='unicode')
+
+	from macuahuitl import write_output
+	write_output(rawxml, user_input, vbw, vbh)
 
 
 if __name__ == '__main__':
@@ -24,14 +24,16 @@
 import math
 import random
 import argparse
-import sys
 import os
 import xml.etree.ElementTree as xtree
 
 
 __author__  = 'Christian Rosentreter'
 __version__ = '1.7'
-__all__     = ['SVGArcPathSegment']
+__all__     = ['SVGArcPathSegment', 'parse_arguments', 'generate_data', 'generate', 'geometry_parameters', 'estimate_cost']
+
+STYLE_OPTIONS = ('color', 'background_color', 'disc_color', 'separate_paths', 'animation_mode', 'animation_duration', 'animation_offset', 'animation_style', 'output', 'output_size', 'export', 'geometry_cache', 'dry_run', 'max_elements', 'max_seconds', 'max_output_bytes')  # no influence on the generated data
+CSS_STEP      = 0.05         # durations of CSS animations are rounded to multiples of this (in seconds), so arcs can share groups
 
 
 
@@ -76,8 +78,8 @@ class SVGArcPathSegment():
 		)
 
 
-def main():
-	"""First, build fire. Second, start coffee."""
+def parse_arguments(args=None):
+	"""Sets up the command line interface and parses the supplied arguments."""
 
 	ap = argparse.ArgumentParser(
 		description=('Concentrically arranges randomly sized arcs into a pretty disc shape. Output is '
@@ -110,13 +112,59 @@ def main():
 	g.add_argument('--animation-mode',                                     help='enables SVG <animateTransform> support', choices=['random', 'bidirectional', 'cascade-in', 'cascade-out'])
 	g.add_argument('--animation-duration', metavar='FLOAT',    type=float, help='defines base duration of one full 360° arc rotation (in seconds); negative inputs switch to counter-clockwise base direction  [:6.0]', default=6.0)
 	g.add_argument('--animation-offset',   metavar='FLOAT',    type=float, help='offset the animation (in seconds) to support rendering to frame sequences for frame based animation formats.  [:0]', default=0.0)
+	g.add_argument('--animation-style',                                    help='express animations as separate SVG <animateTransform> elements for each arc, or as CSS @keyframes rotations of arc groups sharing the same duration and direction (durations are rounded to 0.05 seconds for this)  [:smil]', choices=['smil', 'css'], default='smil')
 
 	g = ap.add_argument_group('Output')
 	g.add_argument('-o', '--output',       metavar='FILENAME', type=str,   help='optionally rasterize the generated vector paths and write the result into a PNG file (requires the `svgcairo\' Python module)')
-	g.add_argument('--output-size',        metavar='INT',      type=int,   help='force pixel width and height of the raster image; if omitted the generated SVG viewbox dimensions are used')
+	g.add_argument('--output-size',        metavar='INT',      type=int,   nargs='+', help='force pixel width and height of the raster image; if omitted the generated SVG viewbox dimensions are used; passing several sizes writes one PNG file for each, the `{size}\' placeholder in the filename is replaced with the size (else it is appended to the filename)')
+	g.add_argument('--preview',            metavar='INT',      type=int,   nargs='?', const=24, help='quickly generate just the INT innermost arcs of the disc, laid out and animated exactly as in the full artwork  [:24]')
+	g.add_argument('--export',             metavar='FILENAME', type=str,   help='write the generated shape data as typed columnar arrays into a binary file instead of printing SVG output')
+	g.add_argument('--geometry-cache',     metavar='DIR',      type=str,   help='reuse the generated layout of earlier runs with the same random seed and algorithm parameters from a cache directory, so changes of style only options are applied without generating everything again; requires --random-seed')
+
+	from macuahuitl import add_limit_arguments
+	add_limit_arguments(ap)
+
+	return ap.parse_args(args)
+
+
+def geometry_parameters(user_input):
+	"""Returns the parts of the parsed user input with influence on the generated data, f.ex. to use as cache key."""
+	parameters = {k:v for k, v in vars(user_input).items() if k not in STYLE_OPTIONS}
+	parameters['version'] = __version__
+	return parameters
+
+
+def estimate_cost(user_input):
+	"""Estimates the number of shape elements, run time, and output size for the parsed user input; nothing is generated.
+
+	Run time and size per arc were measured with the default parameters, random layouts are estimated
+	with their upper limits.
+	"""
+	circles = max(0, user_input.circles)
+	if user_input.preview:
+		circles = min(circles, user_input.preview)
+	stroke  = abs(user_input.stroke_width) if user_input.stroke_width else 1.0
+	gap     = user_input.gap if (user_input.gap is not None) else stroke
+	radius  = max(stroke, abs(user_input.inner_radius) if (user_input.inner_radius is not None) else stroke)
+	radius += (circles + 1) * (gap + stroke)
+	vbw     = vbh = int((radius + (stroke * 0.5)) * (256.0 / (256.0 - 37.35)) * 2.0)
+
+	if user_input.animation_mode:
+		seconds, svg_bytes = circles * 43e-6, circles * 335
+	elif user_input.separate_paths:
+		seconds, svg_bytes = circles * 26e-6, circles * 185
+	else:
+		seconds, svg_bytes = circles * 17e-6, circles * 90
+
+	return {
+		'elements':     circles * (2 if user_input.animation_mode and (user_input.animation_style == 'smil') else 1) + 4,
+		'seconds':      round(seconds, 3),
+		'output_bytes': sum(w * max(1, int(w * vbh / vbw)) * 4 for w in (user_input.output_size or [vbw])) if user_input.output else int(svg_bytes),
+	}
 
-	user_input = ap.parse_args()
 
+def generate_data(user_input):
+	"""Generates the arcs and outlines of a disc from the parsed user input."""
 
 	#  Initialize…
 	#
@@ -154,7 +202,9 @@ def main():
 		outlines.append({'x':x, 'y':y, 'r':radius})
 		radius += (gap + stroke)
 
-	for _ in range(circles):
+	view    = min(circles, user_input.preview) if user_input.preview else circles
+
+	for _ in range(view):
 		# Calculate angular space requirement for the "round" stroke caps to avoid some overlapping
 		sqrd2 = 2.0 * math.pow(radius, 2.0)
 		theta = ((2.0 * math.acos((sqrd2 - math.pow((stroke / 2.0), 2.0)) / sqrd2)) * (180.0 / math.pi))
@@ -162,11 +212,34 @@ def main():
 		arcs.append(SVGArcPathSegment(offset=chaos.uniform(0, 359.0), angle=chaos.uniform(0, 359.0 - theta), radius=radius, x=x, y=y))
 		radius += (gap + stroke)
 
-	if user_input.outline_mode in ('both', 'outside'):
+	for _ in range(view, circles):
+		# outside of the preview; just keep the random numbers in sync for the animation
+		chaos.random()
+		chaos.random()
+
+	if (user_input.outline_mode in ('both', 'outside')) and (view == circles):
 		outlines.append({'x':x, 'y':y, 'r':radius})
 	else:
 		radius -= (gap + stroke)
 
+	return {'chaos':chaos, 'circles':circles, 'arcs':arcs, 'outlines':outlines, 'x':x, 'y':y, 'radius':radius, 'stroke':stroke, 'color':color}
+
+
+def generate(user_input, data=None):
+	"""Generates a disc from the parsed user input, or from already generated data; returns the SVG root element and its viewbox size."""
+
+	if data is None:
+		data = generate_data(user_input)
+
+	chaos    = data['chaos']
+	arcs     = data['arcs']
+	outlines = data['outlines']
+	x        = data['x']
+	y        = data['y']
+	radius   = data['radius']
+	stroke   = data['stroke']
+	color    = data['color'] if user_input.randomize else user_input.color
+
 
 	#  Generate SVG/XML…
 	#
@@ -196,16 +269,19 @@ def main():
 	if arcs:
 		if user_input.separate_paths or user_input.animation_mode:
 			svg_ga = xtree.SubElement(svg_m, 'g', {'id':'arcs'})
+			css_groups = {}
+
 			for aid, a in enumerate(arcs):
 
-				svg_arc = xtree.SubElement(svg_ga, 'path', {'id':'arc-{}'.format(aid+1), 'stroke-linecap':'round', **config})
+				svg_arc = xtree.Element('path', {'id':'arc-{}'.format(aid+1), 'stroke-linecap':'round', **config})
+				svg_parent = svg_ga
 				shift = 0.0
 
 				if user_input.animation_mode:
 					if user_input.animation_mode == 'cascade-out':
 						d = user_input.animation_duration * ((aid+1) * 0.25)  # TODO: 1/4 decay value could be configurable
 					elif user_input.animation_mode == 'cascade-in':
-						d = user_input.animation_duration * ((len(arcs)-aid+1) * 0.25)
+						d = user_input.animation_duration * ((data['circles']-aid+1) * 0.25)
 					else:
 						# limits duration range into a 50% variation window to avoid super fast arcs with values closer to 0
 						d = chaos.uniform(abs(user_input.animation_duration) * 0.5, abs(user_input.animation_duration))  # TODO: variation could be configurable
@@ -214,19 +290,46 @@ def main():
 						if (user_input.animation_mode == 'bidirectional') and (chaos.random() < 0.5):
 							d *= -1  # switch direction randomly
 
+					if user_input.animation_style == 'css':
+						d = math.copysign(max(1, round(abs(d) / CSS_STEP)) * CSS_STEP, d)
+						d = round(d, 2)
+
 					shift = (360.0 / d) * user_input.animation_offset
 
-					xtree.SubElement(svg_arc, 'animateTransform', {
-						'attributeName': 'transform',
-						'type':          'rotate',
-						'from':          '{} {} {}'.format(360 if d < 0 else   0, x, y),
-						'to':            '{} {} {}'.format(  0 if d < 0 else 360, x, y),
-						'dur':           '{}s'.format(abs(d)),
-						'repeatCount':   'indefinite'
-					})
+					if user_input.animation_style == 'css':
+						# arcs sharing duration and direction rotate together inside a single <g>
+						if d not in css_groups:
+							gid = 'spin-{}'.format(len(css_groups)+1)
+							css_groups[d] = xtree.SubElement(svg_ga, 'g', {'id':gid, 'class':gid})
+						svg_parent = css_groups[d]
+					else:
+						xtree.SubElement(svg_arc, 'animateTransform', {
+							'attributeName': 'transform',
+							'type':          'rotate',
+							'from':          '{} {} {}'.format(360 if d < 0 else   0, x, y),
+							'to':            '{} {} {}'.format(  0 if d < 0 else 360, x, y),
+							'dur':           '{}s'.format(abs(d)),
+							'repeatCount':   'indefinite'
+						})
 
 				a.offset += shift
 				svg_arc.set('d', str(a))
+				svg_parent.append(svg_arc)
+
+			if css_groups:
+				# Only one @keyframes rule per direction is needed, durations are assigned per group; this
+				# keeps the stylesheet small even for the cascade modes with their many distinct durations.
+				css = [
+					'@keyframes comitl-cw { from { transform: rotate(0deg); } to { transform: rotate(360deg); } }',
+					'@keyframes comitl-ccw { from { transform: rotate(360deg); } to { transform: rotate(0deg); } }',
+					'#arcs g {{ transform-box: view-box; transform-origin: {}px {}px; animation-timing-function: linear; '
+						'animation-iteration-count: infinite; will-change: transform; }}'.format(_f(x), _f(y)),
+				]
+				for gid, d in enumerate(css_groups):
+					css.append('.spin-{} {{ animation-name: {}; animation-duration: {}s; }}'.format(gid+1, 'comitl-ccw' if d < 0 else 'comitl-cw', abs(d)))
+				svg_style = xtree.Element('style')
+				svg_style.text = '\n'.join(css)
+				svg.insert(list(svg).index(title) + 1, svg_style)
 		else:
 			xtree.SubElement(svg_m, 'path', {'id':'arcs', 'd':''.join(map(str, arcs)), 'stroke-linecap':'round', **config})
 
@@ -237,23 +340,44 @@ def main():
 
 	svg.append(xtree.Comment(' Generator: comitl.py {} (https://github.com/the-real-tokai/macuahuitl) '.format(__version__)))
 
-	rawxml = xtree.tostring(svg, encoding='unicode')
+	return svg, float(vb_dim), float(vb_dim)
+
+
+def main():
+	"""First, build fire. Second, start coffee."""
+
+	user_input = parse_arguments()
+
+	from macuahuitl import check_limits
+	check_limits(user_input, estimate_cost)
+
+	from macuahuitl import generated_data
+	data = generated_data('comitl', user_input, geometry_parameters, generate_data)
+
+	if user_input.export:
+		from macuahuitl import write_columns
+		write_columns(os.path.realpath(os.path.expanduser(user_input.export)), 'comitl', [
+			('offset', 'd', (a.offset for a in data['arcs'])),
+			('angle',  'd', (a.angle  for a in data['arcs'])),
+			('radius', 'd', (a.radius for a in data['arcs'])),
+		], {
+			'x':        data['x'],
+			'y':        data['y'],
+			'stroke':   data['stroke'],
+			'color':    data['color'],
+			'outlines': [o['r'] for o in data['outlines']],
+		})
+		if not user_input.output:
+			return
+
+	svg, vbw, vbh = generate(user_input, data)
+	rawxml        = xtree.tostring(svg, encoding='unicode')
 
 
 	#  Send happy little arcs out into the world…
 	#
-	if not user_input.output:
-		print(rawxml)
-	else:
-		try:
-			from cairosvg import svg2png
-			svg2png(bytestring=rawxml,
-				write_to=os.path.realpath(os.path.expanduser(user_input.output)),
-				output_width=user_input.output_size,
-				output_height=user_input.output_size
-			)
-		except ImportError as e:
-			print('Couldn\'t rasterize nor write a PNG file. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+	from macuahuitl import write_output
+	write_output(rawxml, user_input, vbw, vbh)
 
 
 if __name__ == "__main__":
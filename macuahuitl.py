@@ -0,0 +1,929 @@
+#!/usr/bin/env python3
+"""
+	Macuahuitl
+	Drives the individual generators of the toolbox for batch work, f.ex. to lay
+	out many variations of an artwork on a single contact sheet.
+
+	Copyright © 2020 Christian Rosentreter
+
+	This program is free software: you can redistribute it and/or modify
+	it under the terms of the GNU Affero General Public License as published
+	by the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU Affero General Public License for more details.
+
+	You should have received a copy of the GNU Affero General Public License
+	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import array
+import collections
+import functools
+import hashlib
+import heapq
+import importlib
+import io
+import itertools
+import json
+import math
+import mmap
+import os
+import pickle
+import re
+import sys
+import tempfile
+import time
+import zlib
+import xml.etree.ElementTree as xtree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+__author__  = 'Christian Rosentreter'
+__version__ = '1.0'
+__all__     = ['TOOLS', 'seed_range', 'POOL_BACKENDS', 'gil_enabled', 'worker_pool', 'render_variation', 'write_variation', 'render_batch', 'benchmark_backends', 'scoped_variation', 'contact_sheet', 'write_columns', 'read_columns', 'placeholder_filename', 'sized_filename', 'rasterize', 'STRIP_PIXELS', 'write_png', 'write_output', 'cached_data', 'generated_data', 'LIMITS', 'add_limit_arguments', 'exceeded_limit', 'check_limits', 'SEARCH_SCORES', 'score_seeds', 'seed_search', 'tile_pyramid', 'rasterize_strips', 'npy_header', 'render_sample', 'write_dataset']
+
+TOOLS  = ('comitl', 'altepetl', 'temo', 'teocuitlatl')
+SVG_NS = 'http://www.w3.org/2000/svg'
+DZI_NS = 'http://schemas.microsoft.com/deepzoom/2008'
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+NPY_MAGIC     = b'\x93NUMPY\x01\x00'  # format version 1.0
+STRIP_PIXELS  = 6000 * 6000  # single PNG files with more pixels are rasterized in strips on a process pool
+
+POOL_BACKENDS = {'process':ProcessPoolExecutor, 'thread':ThreadPoolExecutor}
+
+SEARCH_SCORES = {'temo':'best_path_length'}  # tool → function rating a variation, higher is better
+
+LIMITS = (  # cost estimate key, description, option
+	('elements',     'number of shape elements', 'max_elements'),
+	('seconds',      'run time in seconds',      'max_seconds'),
+	('output_bytes', 'output size in bytes',     'max_output_bytes'),
+)
+
+COLUMNS_MAGIC = b'MCHTCOL1'
+COLUMNS_TYPES = {'B':'|u1', 'H':'<u2', 'i':'<i4', 'f':'<f4', 'd':'<f8'}  # array typecode → NumPy compatible type string
+
+
+
+def seed_range(text):
+	"""Converts a 'FIRST:LAST' specification (both inclusive) into a range of seeds."""
+	try:
+		first, last = (int(v) for v in text.split(':'))
+	except ValueError:
+		raise argparse.ArgumentTypeError('invalid seed range "{}"; expected FIRST:LAST'.format(text)) from None
+	if last < first:
+		raise argparse.ArgumentTypeError('invalid seed range "{}"; LAST is smaller than FIRST'.format(text))
+	return range(first, last + 1)
+
+
+def gil_enabled():
+	"""Returns whether the running Python uses a global interpreter lock; free-threaded builds (3.13+) may run without one."""
+	return getattr(sys, '_is_gil_enabled', lambda: True)()
+
+
+def worker_pool(backend=None, jobs=None, **kwargs):
+	"""Returns an executor of the given backend with one worker per job (if omitted, per available core).
+
+	Without an explicit backend threads are used on free-threaded builds of Python, where they run
+	concurrently without the pickling and the duplicated imports of worker processes, else processes.
+	"""
+	backend = backend if backend else ('process' if gil_enabled() else 'thread')
+	return POOL_BACKENDS[backend](max_workers=jobs if jobs else (os.cpu_count() or 1), **kwargs)
+
+
+def render_variation(tool, args, seed):
+	"""Generates one artwork with the given tool, its command line arguments and a fixed seed; returns raw SVG/XML data."""
+	module     = importlib.import_module(tool)
+	user_input = module.parse_arguments(list(args) + ['--random-seed', str(seed)])
+	svg, _, _  = module.generate(user_input)
+	return xtree.tostring(svg, encoding='unicode')
+
+
+def write_variation(tool, args, filename, seed):
+	"""Generates one artwork with the given tool and a fixed seed, and writes it into a file; returns the filename.
+
+	The '{seed}' placeholder of the filename template is replaced with the seed, files ending in
+	".png" are rasterized.
+	"""
+	filename = placeholder_filename(filename, 'seed', seed)
+	rawxml   = render_variation(tool, args, seed)
+	if filename.lower().endswith('.png'):
+		from cairosvg import svg2png
+		svg2png(bytestring=rawxml, write_to=filename)
+	else:
+		with open(filename, 'w', encoding='utf-8') as f:
+			f.write(rawxml)
+	return filename
+
+
+def render_batch(tool, args, seeds, filename, *, backend=None, jobs=None):
+	"""Generates an artwork for each seed on a worker pool and writes each into its own file; yields the filenames in order."""
+	with worker_pool(backend, jobs) as pool:
+		yield from pool.map(functools.partial(write_variation, tool, args, filename), seeds)
+
+
+def benchmark_backends(tool, args, seeds, jobs=None):
+	"""Generates the artworks for the seeds (without writing them) with each worker pool backend; returns the wall-clock seconds of each."""
+	seeds   = list(seeds)
+	results = {}
+	for backend in POOL_BACKENDS:
+		start = time.perf_counter()
+		with worker_pool(backend, jobs) as pool:
+			collections.deque(pool.map(functools.partial(render_variation, tool, args), seeds), maxlen=0)
+		results[backend] = time.perf_counter() - start
+	return results
+
+
+def scoped_variation(rawxml, prefix):
+	"""Parses the SVG data of a variation for a contact sheet; returns its root element with all ids and class names prefixed.
+
+	Variations of a tool use the same ids and class names, so they are made unique on the sheet,
+	along with the references to them in attributes and the selectors of <style> elements; else the
+	CSS animation rules of one Comitl variation would apply to the arcs of all others. The SVG
+	namespace is dropped from the tags again, as the generators write them without one.
+	"""
+	def _references(text):
+		return re.sub(r'url\(#([\w-]+)\)', lambda m: 'url(#' + prefix + m.group(1) + ')', text)
+
+	def _selectors(css):
+		return re.sub(r'[^{}]+\{', lambda rule: re.sub(r'([#.])([A-Za-z_][\w-]*)', lambda m: m.group(1) + prefix + m.group(2), rule.group(0)), css)
+
+	root = xtree.fromstring(rawxml)
+	for element in root.iter():
+		element.tag = element.tag.split('}')[-1]
+		for name, value in list(element.attrib.items()):
+			if name == 'id':
+				element.set(name, prefix + value)
+			elif name == 'class':
+				element.set(name, ' '.join(prefix + c for c in value.split()))
+			elif name.endswith('href') and value.startswith('#'):
+				element.set(name, '#' + prefix + value[1:])
+			else:
+				element.set(name, _references(value))
+		if (element.tag == 'style') and element.text:
+			element.text = _selectors(element.text)
+	return root
+
+
+def contact_sheet(tool, args, seeds, *, columns=None, cell_size=200.0, jobs=None, backend=None):
+	"""Generates variations for a range of seeds on a worker pool and lays them out in a labeled grid.
+
+	Every variation is embedded as a nested <svg> viewport, so each tool's own viewBox setup is used
+	unchanged; its ids and class names are prefixed with its seed by scoped_variation(). Returns the
+	SVG root element of the sheet and its viewbox size.
+	"""
+	seeds   = list(seeds)
+	columns = max(1, columns if columns else math.ceil(math.sqrt(len(seeds))))
+	rows    = max(1, math.ceil(len(seeds) / columns))
+	gap     = cell_size * 0.1
+	label   = cell_size * 0.12
+	vbw     = gap + columns * (cell_size + gap)
+	vbh     = gap + rows * (cell_size + label + gap)
+
+	sheet = xtree.Element('svg', {'width':'100%', 'height':'100%', 'xmlns':SVG_NS, 'viewBox':'0 0 {:g} {:g}'.format(vbw, vbh)})
+	title = xtree.SubElement(sheet, 'title')
+	title.text = '{} Contact Sheet'.format(tool.capitalize())
+	xtree.SubElement(sheet, 'rect', {'id':'background', 'x':'0', 'y':'0', 'width':'{:g}'.format(vbw), 'height':'{:g}'.format(vbh), 'fill':'white'})
+
+	with worker_pool(backend, jobs) as pool:
+		variations = pool.map(functools.partial(render_variation, tool, args), seeds)
+		for i, (seed, rawxml) in enumerate(zip(seeds, variations)):
+			x = gap + (i % columns) * (cell_size + gap)
+			y = gap + (i // columns) * (cell_size + label + gap)
+
+			cell = scoped_variation(rawxml, 'seed-{}-'.format(seed))
+			cell.attrib.update({'id':'seed-{}'.format(seed), 'x':'{:g}'.format(x), 'y':'{:g}'.format(y), 'width':'{:g}'.format(cell_size), 'height':'{:g}'.format(cell_size)})
+			sheet.append(cell)
+
+			text = xtree.SubElement(sheet, 'text', {
+				'x':           '{:g}'.format(x + cell_size / 2.0),
+				'y':           '{:g}'.format(y + cell_size + label * 0.75),
+				'font-family': 'sans-serif',
+				'font-size':   '{:g}'.format(label * 0.6),
+				'text-anchor': 'middle',
+				'fill':        'black',
+			})
+			text.text = 'seed {}'.format(seed)
+
+	return sheet, vbw, vbh
+
+
+def score_seeds(tool, args, seeds):
+	"""Rates the variations of a tool for a batch of seeds; returns a list of (score, seed) tuples."""
+	module     = importlib.import_module(tool)
+	score      = getattr(module, SEARCH_SCORES[tool])
+	user_input = module.parse_arguments(list(args))
+	results    = []
+	for seed in seeds:
+		user_input.random_seed = seed
+		results.append((score(user_input), seed))
+	return results
+
+
+def seed_search(tool, args, seeds, *, top=10, target=None, jobs=None, batch_size=50, backend=None):
+	"""Rates variations for a range of seeds on a worker pool; returns the best (seed, score) pairs, best first.
+
+	Seeds are handed out to the workers in batches. With a target score no further batches are
+	handed out once a variation reaches it, batches already being worked on are still collected.
+	"""
+	jobs    = jobs if jobs else (os.cpu_count() or 1)
+	seeds   = iter(seeds)
+	batches = iter(lambda: list(itertools.islice(seeds, batch_size)), [])
+	best    = []  # min-heap of (score, -seed), so the lowest seed wins a tie
+	found   = False
+
+	with worker_pool(backend, jobs) as pool:
+		pending = set()
+		while True:
+			if not found:
+				for batch in itertools.islice(batches, jobs * 2 - len(pending)):
+					pending.add(pool.submit(score_seeds, tool, args, batch))
+			if not pending:
+				break
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				for score, seed in future.result():
+					heapq.heappush(best, (score, -seed))
+					if len(best) > top:
+						heapq.heappop(best)
+					if target is not None and score >= target:
+						found = True
+
+	return [(-seed, score) for score, seed in sorted(best, reverse=True)]
+
+
+def write_columns(filename, tool, columns, attributes=None):
+	"""Writes columns of typed values into a binary file that can be memory-mapped by importers.
+
+	The file starts with the 8 byte magic "MCHTCOL1", followed by the length of the header as little
+	endian uint32 and the UTF-8 encoded JSON header itself. The header lists name, type, absolute file
+	offset, and number of values of each column, plus the tool specific scalar attributes. Column data
+	is stored in little endian byte order, every column starts at an offset aligned to 8 bytes.
+
+	'columns' is a sequence of (name, array typecode, values) tuples.
+	"""
+	arrays = [(name, array.array(typecode, values)) for name, typecode, values in columns]
+	if sys.byteorder == 'big':
+		for _, a in arrays:
+			a.byteswap()
+
+	def _align(v):
+		return (v + 7) & ~7
+
+	def _header(start):
+		layout, pos = [], start
+		for name, a in arrays:
+			layout.append({'name':name, 'type':COLUMNS_TYPES[a.typecode], 'offset':pos, 'count':len(a)})
+			pos = _align(pos + len(a) * a.itemsize)
+		return json.dumps({'tool':tool, 'version':1, 'attributes':attributes or {}, 'columns':layout}).encode('utf-8')
+
+	# the column offsets depend on the header size and vice versa; settles after a few rounds
+	start = 0
+	while True:
+		header = _header(start)
+		if _align(len(COLUMNS_MAGIC) + 4 + len(header)) <= start:
+			break
+		start = _align(len(COLUMNS_MAGIC) + 4 + len(header))
+	header = header.ljust(start - len(COLUMNS_MAGIC) - 4, b' ')
+
+	with open(filename, 'wb') as f:
+		f.write(COLUMNS_MAGIC)
+		f.write(len(header).to_bytes(4, 'little'))
+		f.write(header)
+		for _, a in arrays:
+			f.write(b'\0' * (_align(f.tell()) - f.tell()))
+			a.tofile(f)
+
+
+def read_columns(filename):
+	"""Memory-maps a file written by write_columns(); returns the header and a dictionary of column views.
+
+	The views are typed memoryviews backed by the mapped file, and only valid on little endian hosts.
+	"""
+	with open(filename, 'rb') as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	if data[:len(COLUMNS_MAGIC)] != COLUMNS_MAGIC:
+		raise ValueError('{} is not a columnar shape data file'.format(filename))
+	size   = int.from_bytes(data[len(COLUMNS_MAGIC):len(COLUMNS_MAGIC) + 4], 'little')
+	header = json.loads(data[len(COLUMNS_MAGIC) + 4:len(COLUMNS_MAGIC) + 4 + size].decode('utf-8'))
+	typecodes = {v:k for k, v in COLUMNS_TYPES.items()}
+	views  = {}
+	for c in header['columns']:
+		typecode = typecodes[c['type']]
+		itemsize = array.array(typecode).itemsize
+		views[c['name']] = memoryview(data)[c['offset']:c['offset'] + c['count'] * itemsize].cast(typecode)
+	return header, views
+
+
+def placeholder_filename(filename, name, value):
+	"""Expands a placeholder like '{size}' of a filename template, or appends the value to the base name."""
+	if '{' + name + '}' in filename:
+		return filename.replace('{' + name + '}', str(value))
+	root, ext = os.path.splitext(filename)
+	return '{}-{}{}'.format(root, value, ext)
+
+
+def sized_filename(filename, size):
+	"""Expands the '{size}' placeholder of a filename template, or appends the size to the base name."""
+	return placeholder_filename(filename, 'size', size)
+
+
+def rasterize(rawxml, filename, sizes, vbw, vbh):
+	"""Rasterizes SVG data into one PNG file per pixel width while parsing the SVG data only once.
+
+	Sizes of at most half the width of an already rendered image are derived by downscaling that
+	image, which is much cheaper than drawing all the vector shapes again. The drawing code of
+	'cairosvg' updates the parsed tree while rendering, so the remaining sizes are rendered one
+	after the other rather than concurrently from the shared tree.
+	"""
+	import cairocffi
+	from cairosvg.parser import Tree
+	from cairosvg.surface import PNGSurface
+
+	tree     = Tree(bytestring=rawxml.encode('utf-8'))
+	rendered = []
+
+	for size in sorted(set(sizes), reverse=True):
+		width  = int(size)
+		height = max(1, int(size * vbh / vbw))
+		source = next((r for r in reversed(rendered) if r.get_width() >= width * 2), None)
+
+		if source is None:
+			surface = PNGSurface(tree, None, 96, output_width=width, output_height=height).cairo
+			rendered.append(surface)
+		else:
+			surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+			context = cairocffi.Context(surface)
+			context.scale(width / source.get_width(), height / source.get_height())
+			context.set_source_surface(source)
+			context.get_source().set_filter(cairocffi.FILTER_GOOD)
+			context.paint()
+
+		surface.write_to_png(sized_filename(filename, size))
+
+
+def write_png(rawxml, filename, sizes, vbw, vbh):
+	"""Rasterizes the SVG data of a generator into PNG files, as set up with its `-o' and `--output-size' options.
+
+	Several sizes are rendered by rasterize(), single images with more than STRIP_PIXELS pixels in
+	strips by rasterize_strips(), all others directly by 'cairosvg'. Heights follow the aspect ratio
+	of the viewbox; without any size the viewbox size is used.
+	"""
+	if sizes and len(sizes) > 1:
+		rasterize(rawxml, filename, sizes, vbw, vbh)
+	elif (sizes[0] if sizes else vbw) ** 2 * vbh / vbw > STRIP_PIXELS:
+		width = int(sizes[0] if sizes else vbw)
+		rasterize_strips(rawxml, filename, width, max(1, int(width * vbh / vbw)))
+	else:
+		from cairosvg import svg2png
+		svg2png(
+			bytestring    = rawxml,
+			write_to      = filename,
+			output_width  = sizes[0] if sizes else None,
+			output_height = max(1, int(sizes[0] * vbh / vbw)) if sizes else None
+		)
+
+
+def write_output(rawxml, user_input, vbw, vbh):
+	"""Prints the SVG data of a generator, or rasterizes it into the PNG files set up with its `-o' and `--output-size' options."""
+	if not user_input.output:
+		print(rawxml)
+		return
+	try:
+		write_png(rawxml, os.path.realpath(os.path.expanduser(user_input.output)), user_input.output_size, vbw, vbh)
+	except ImportError as e:
+		print('Couldn\'t rasterize nor write the PNG file. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+
+
+def png_chunk(kind, payload):
+	"""Returns a complete PNG chunk with the given type and payload."""
+	return len(payload).to_bytes(4, 'big') + kind + payload + zlib.crc32(kind + payload).to_bytes(4, 'big')
+
+
+def png_scanlines(data):
+	"""Returns the filtered scanlines of 8-bit RGBA PNG data, ready to be appended to the scanlines of another image.
+
+	Filters reference the previous scanline, which for the first one is implied to be all zero. That
+	scanline is therefore converted to filter type 0 (none), all others are left as they are.
+	"""
+	pos, idat, width = len(PNG_SIGNATURE), [], 0
+	while pos < len(data):
+		length = int.from_bytes(data[pos:pos + 4], 'big')
+		kind   = data[pos + 4:pos + 8]
+		if kind == b'IHDR':
+			width = int.from_bytes(data[pos + 8:pos + 12], 'big')
+			if data[pos + 16:pos + 21] != bytes((8, 6, 0, 0, 0)):
+				raise ValueError('unsupported PNG data; expected 8-bit RGBA without interlacing')
+		elif kind == b'IDAT':
+			idat.append(data[pos + 8:pos + 8 + length])
+		pos += length + 12
+
+	lines  = bytearray(zlib.decompress(b''.join(idat)))
+	stride = width * 4
+	if lines[0] in (1, 3, 4):  # sub, average, paeth; with an all zero previous scanline paeth equals sub
+		shift = 1 if lines[0] == 3 else 0
+		for i in range(5, stride + 1):
+			lines[i] = (lines[i] + (lines[i - 4] >> shift)) & 0xff
+	lines[0] = 0  # (up is a no-op on the first scanline)
+	return bytes(lines)
+
+
+def adler32_combine(adler1, adler2, length2):
+	"""Returns the Adler-32 checksum of two concatenated pieces of data from the checksums of both and the length of the second one."""
+	a1, b1 = adler1 & 0xffff, adler1 >> 16
+	a2, b2 = adler2 & 0xffff, adler2 >> 16
+	return (((b1 + b2 + length2 * (a1 - 1)) % 65521) << 16) | ((a1 + a2 - 1) % 65521)
+
+
+_STRIP_TREE = {}  # parsed SVG data of a strip rendering worker process
+
+
+def _init_strip_worker(rawxml):
+	"""Parses the SVG data once in a strip rendering worker process, instead of for every strip."""
+	from cairosvg.parser import Tree
+	_STRIP_TREE['tree'] = Tree(bytestring=rawxml.encode('utf-8'))
+
+
+def render_strip(top, rows, width, height):
+	"""Rasterizes the given rows of the full size image of a strip rendering worker's SVG data; returns their compressed PNG scanlines.
+
+	The scanlines are compressed into raw deflate blocks which end on a byte boundary (a full flush),
+	so the blocks of all strips can be concatenated into one stream. The Adler-32 checksum and the
+	length of the scanlines are returned along with them, for the checksum of the whole stream.
+	"""
+	import cairocffi
+	from cairosvg.surface import PNGSurface
+
+	class _StripSurface(PNGSurface):
+		def _create_surface(self, width, height):
+			return cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, int(round(width)), rows), int(round(width)), int(round(height))
+
+		def set_context_size(self, width, height, viewbox, tree):
+			self.context.translate(0, -top)  # the full image is laid out as usual, the surface just covers the strip
+			super().set_context_size(width, height, viewbox, tree)
+
+	surface = _StripSurface(_STRIP_TREE['tree'], None, 96, output_width=width, output_height=height)
+	png     = io.BytesIO()
+	surface.cairo.write_to_png(png)
+	scanlines = png_scanlines(png.getvalue())
+	deflate   = zlib.compressobj(6, zlib.DEFLATED, -15)
+	return deflate.compress(scanlines) + deflate.flush(zlib.Z_FULL_FLUSH), zlib.adler32(scanlines), len(scanlines)
+
+
+def rasterize_strips(rawxml, filename, width, height, *, jobs=None, strip_pixels=1 << 24):
+	"""Rasterizes SVG data into a single, large PNG file by rendering horizontal strips on a process pool.
+
+	Every worker parses the SVG data once and draws each of its strips from the parsed tree onto a
+	surface covering just the strip, then compresses its scanlines. The compressed strips are written
+	in order as parts of one zlib stream, so this process only adds the stream's header, its end and
+	the checksum. Memory use is bound by the parsed tree of each worker and a few strips rather than
+	by the size of the image. All shapes are drawn again for each strip (cairo only clips them), so
+	the strips are as tall as 'strip_pixels' allows, but still split the image up for all workers.
+	"""
+	jobs     = jobs if jobs else (os.cpu_count() or 1)
+	rows     = max(1, min(strip_pixels // width, -(-height // jobs)))
+	checksum = zlib.adler32(b'')
+
+	with open(filename, 'wb') as f, ProcessPoolExecutor(max_workers=jobs, initializer=_init_strip_worker, initargs=(rawxml,)) as pool:
+		f.write(PNG_SIGNATURE)
+		f.write(png_chunk(b'IHDR', width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + bytes((8, 6, 0, 0, 0))))
+		f.write(png_chunk(b'IDAT', b'\x78\x9c'))  # zlib header: deflate with a 32K window, default compression
+
+		def _write(strip):
+			nonlocal checksum
+			data, adler, length = strip
+			checksum = adler32_combine(checksum, adler, length)
+			f.write(png_chunk(b'IDAT', data))
+
+		pending = collections.deque()
+		for top in range(0, height, rows):
+			strip = min(rows, height - top)
+			pending.append(pool.submit(render_strip, top, strip, width, height))
+			if len(pending) >= jobs * 2:  # strips are written in order; keep only a few of them around
+				_write(pending.popleft().result())
+		while pending:
+			_write(pending.popleft().result())
+
+		f.write(png_chunk(b'IDAT', zlib.compressobj(6, zlib.DEFLATED, -15).flush() + checksum.to_bytes(4, 'big')))  # an empty final block
+		f.write(png_chunk(b'IEND', b''))
+
+
+def npy_header(shape, descr='|u1'):
+	"""Returns the header of a NumPy .npy file (format version 1.0) for a C-ordered array of the given shape and type."""
+	header = "{{'descr': '{}', 'fortran_order': False, 'shape': {!r}, }}".format(descr, tuple(int(n) for n in shape))
+	header = header + ' ' * (-(len(NPY_MAGIC) + 2 + len(header) + 1) % 64) + '\n'  # data starts at a multiple of 64
+	return NPY_MAGIC + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+_DATASET_MAPS = {}  # shard filename → writable memory map of a dataset worker
+
+
+def _dataset_map(filename):
+	"""Returns a writable memory map of a shard file, opened once per worker and shard.
+
+	Only the map of the current shard is kept, maps of earlier shards are released as soon as no
+	sample is rendered into them anymore.
+	"""
+	pixels = _DATASET_MAPS.get(filename)
+	if pixels is None:
+		with open(filename, 'r+b') as f:
+			pixels = mmap.mmap(f.fileno(), 0)
+		_DATASET_MAPS.clear()
+		_DATASET_MAPS[filename] = pixels
+	return pixels
+
+
+_PARTIAL_ALPHA = bytes([0] + [1] * 254 + [0])
+
+
+def _straight_rgba(pixels):
+	"""Converts premultiplied 32-bit ARGB pixels in native byte order, as drawn by cairo, in place into straight RGBA bytes.
+
+	Only the partially transparent pixels need a division, which mostly are the antialiased edges.
+	"""
+	channels = (2, 1, 0, 3) if sys.byteorder == 'little' else (1, 2, 3, 0)
+	r, g, b  = (bytearray(pixels[i::4]) for i in channels[:3])
+	a        = bytes(pixels[channels[3]::4])
+	partial  = a.translate(_PARTIAL_ALPHA)
+	i        = partial.find(1)
+	while i >= 0:
+		alpha = a[i]
+		for c in (r, g, b):
+			c[i] = min(255, (c[i] * 255 + alpha // 2) // alpha)
+		i = partial.find(1, i + 1)
+	pixels[0::4], pixels[1::4], pixels[2::4], pixels[3::4] = r, g, b, a
+
+
+def render_sample(tool, args, sample, size, seed):
+	"""Rasterizes the artwork of a tool for a seed straight into a memory-mapped shard file; returns its generation parameters.
+
+	The 'sample' is the filename of the shard and the offset of the sample in there, 'size' is the
+	width and height of the samples. The cairo surface is created on top of the sample's bytes of
+	the memory map, so the pixels are drawn in place; afterwards they are converted in place from
+	cairo's premultiplied ARGB in native byte order into straight (not premultiplied) R, G, B, A
+	bytes, as in PNG files.
+	"""
+	import cairocffi
+	from cairosvg.parser import Tree
+	from cairosvg.surface import PNGSurface
+
+	module           = importlib.import_module(tool)
+	user_input       = module.parse_arguments(list(args) + ['--random-seed', str(seed)])
+	svg, _, _        = module.generate(user_input)
+	filename, offset = sample
+	width, height    = size
+	pixels           = memoryview(_dataset_map(filename))[offset:offset + width * height * 4]
+
+	class _SampleSurface(PNGSurface):
+		def _create_surface(self, width, height):
+			width, height = int(round(width)), int(round(height))
+			return cairocffi.ImageSurface.create_for_data(pixels, cairocffi.FORMAT_ARGB32, width, height, width * 4), width, height
+
+	surface = _SampleSurface(Tree(bytestring=xtree.tostring(svg)), None, 96, output_width=width, output_height=height)
+	surface.cairo.flush()
+	surface.finish()
+	_straight_rgba(pixels)
+	return module.geometry_parameters(user_input)
+
+
+def write_dataset(tool, args, seeds, filename, size, *, shard_size=1000, backend=None, jobs=None):
+	"""Rasterizes the artworks for a range of seeds into fixed-shape uint8 arrays in memory-mapped .npy shard files.
+
+	Every shard holds up to 'shard_size' samples in an array of shape (samples, height, width, 4).
+	The shard files are set up with their final size first, then each worker renders its samples
+	right into their region of the file. The generation parameters of the samples are written as
+	JSON lines into an index file next to the shards; returns the filenames of the shards and of
+	the index.
+	"""
+	width, height = size
+	seeds         = list(seeds)
+	sample        = width * height * 4
+	shards        = []
+	index         = os.path.splitext(placeholder_filename(filename, 'shard', 'index'))[0] + '.jsonl'
+
+	with open(index, 'w', encoding='utf-8') as f, worker_pool(backend, jobs) as pool:
+		for shard, first in enumerate(range(0, len(seeds), shard_size)):
+			batch  = seeds[first:first + shard_size]
+			shards.append(placeholder_filename(filename, 'shard', '{:05d}'.format(shard)))
+			header = npy_header((len(batch), height, width, 4))
+			with open(shards[-1], 'wb') as npy:
+				npy.write(header)
+				npy.truncate(len(header) + len(batch) * sample)
+
+			offsets = [len(header) + i * sample for i in range(0, len(batch))]
+			results = pool.map(render_sample, itertools.repeat(tool), itertools.repeat(args), zip(itertools.repeat(shards[-1]), offsets),
+				itertools.repeat(size), batch)
+			for i, (seed, parameters) in enumerate(zip(batch, results)):
+				f.write(json.dumps({'shard':os.path.basename(shards[-1]), 'index':i, 'seed':seed, 'tool':tool, 'parameters':parameters}, default=str) + '\n')
+
+	return shards, index
+
+
+def cached_data(cache_dir, tool, parameters, generator):
+	"""Returns generated data for the given tool and parameters from a cache directory.
+
+	On a cache miss the data is produced by calling 'generator' and stored for later runs. The
+	parameters must cover everything with influence on the data, they are hashed into the key.
+	"""
+	key  = hashlib.sha256(json.dumps([tool, parameters], sort_keys=True).encode('utf-8')).hexdigest()
+	path = os.path.join(cache_dir, '{}-{}.pickle'.format(tool, key))
+
+	try:
+		with open(path, 'rb') as f:
+			return pickle.load(f)
+	except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):  # missing, damaged, or pickled by an incompatible version; just regenerate
+		pass
+
+	data = generator()
+
+	os.makedirs(cache_dir, exist_ok=True)
+	fd, temp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+	with os.fdopen(fd, 'wb') as f:
+		pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(temp, path)
+
+	return data
+
+
+def generated_data(tool, user_input, geometry_parameters, generate_data):
+	"""Returns the data generated by a tool's generate_data() function, from the geometry cache if one is set up with `--geometry-cache'."""
+	if user_input.geometry_cache and (user_input.random_seed is not None):
+		return cached_data(os.path.realpath(os.path.expanduser(user_input.geometry_cache)), tool, geometry_parameters(user_input), lambda: generate_data(user_input))
+	if user_input.geometry_cache:
+		print('Warning: The geometry cache requires a fixed random seed (`--random-seed\'), ignoring it.', file=sys.stderr)
+	return generate_data(user_input)
+
+
+def add_limit_arguments(ap):
+	"""Adds the `Limits' options shared by all generators to their command line interface."""
+	g = ap.add_argument_group('Limits')
+	g.add_argument('--dry-run',          action='store_true',             help='print an estimate of the work and output size for the given parameters as JSON, without generating anything')
+	g.add_argument('--max-elements',     metavar='INT',        type=int,   help='refuse to generate artworks with an estimated number of shape elements above this limit')
+	g.add_argument('--max-seconds',      metavar='FLOAT',      type=float, help='refuse to generate artworks with an estimated run time (in seconds) above this limit')
+	g.add_argument('--max-output-bytes', metavar='INT',        type=int,   help='refuse to generate artworks with an estimated output size (in bytes) above this limit')
+
+
+def exceeded_limit(user_input, estimate_cost):
+	"""Returns a description of the first limit exceeded by the estimated cost of a generator's parsed user input, or None.
+
+	The cost is only estimated (with the generator's estimate_cost() function) when a limit is set.
+	"""
+	if all(getattr(user_input, option) is None for _, _, option in LIMITS):
+		return None
+
+	cost = estimate_cost(user_input)
+	for key, label, option in LIMITS:
+		limit = getattr(user_input, option)
+		if (limit is not None) and (cost[key] > limit):
+			return 'The estimated {} ({:g}) exceeds the limit set with `--{}\' ({:g}).'.format(label, cost[key], option.replace('_', '-'), limit)
+	return None
+
+
+def check_limits(user_input, estimate_cost):
+	"""Handles the `Limits' options of a generator: prints the estimated cost of a dry run, or refuses exceeded limits; both exit."""
+	if user_input.dry_run:
+		print(json.dumps(estimate_cost(user_input)))
+		sys.exit(0)
+	error = exceeded_limit(user_input, estimate_cost)
+	if error:
+		print('Error: {}'.format(error), file=sys.stderr)
+		sys.exit(1)
+
+
+def downsample_tile(children, width, height):
+	"""Composes a tile from up to four tiles of the next higher pyramid level at half their size; returns PNG data.
+
+	'children' is a list of (filename, x, y) tuples with the placement of each child in the new tile.
+	"""
+	import cairocffi
+
+	surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+	context = cairocffi.Context(surface)
+	for filename, x, y in children:
+		context.save()
+		context.translate(x, y)
+		context.scale(0.5, 0.5)
+		context.set_source_surface(cairocffi.ImageSurface.create_from_png(filename))
+		context.get_source().set_filter(cairocffi.FILTER_GOOD)
+		context.paint()
+		context.restore()
+
+	png = io.BytesIO()
+	surface.write_to_png(png)
+	return png.getvalue()
+
+
+def write_tile(filename, function, args):
+	"""Calls a tile rendering function and writes the returned PNG data into a file."""
+	data = function(*args)
+	with open(filename, 'wb') as f:
+		f.write(data)
+
+
+def tile_pyramid(filename, width, height, tiles, *, tile_size=256, jobs=None):
+	"""Writes a Deep Zoom image: a .dzi descriptor and a pyramid of PNG tiles in a "_files" directory next to it.
+
+	The tiles of the highest level are rendered on a process pool. For each of them 'tiles' is called
+	with its pixel box (left, top, width, height) and returns a function and its arguments, which
+	are passed on to a worker and return the PNG data of the tile. The tiles of all lower levels are
+	composed from four tiles of the next higher level, so memory use is bound by the tile size and
+	the number of workers rather than by the size of the image.
+	"""
+	root, _ = os.path.splitext(filename)
+	jobs    = jobs if jobs else (os.cpu_count() or 1)
+	top     = max(0, math.ceil(math.log2(max(width, height))))
+
+	def _size(level):
+		return (math.ceil(width / 2 ** (top - level)), math.ceil(height / 2 ** (top - level)))
+
+	def _grid(level):
+		w, h = _size(level)
+		return (math.ceil(w / tile_size), math.ceil(h / tile_size))
+
+	def _path(level, col, row):
+		return os.path.join('{}_files'.format(root), str(level), '{}_{}.png'.format(col, row))
+
+	with ProcessPoolExecutor(max_workers=jobs) as pool:
+		for level in range(top, -1, -1):
+			os.makedirs(os.path.dirname(_path(level, 0, 0)), exist_ok=True)
+			w, h       = _size(level)
+			cols, rows = _grid(level)
+			pending    = set()
+
+			for row in range(0, rows):
+				for col in range(0, cols):
+					box = (col * tile_size, row * tile_size, min(tile_size, w - col * tile_size), min(tile_size, h - row * tile_size))
+					if level == top:
+						function, args = tiles(*box)
+					else:
+						ccols, crows = _grid(level + 1)
+						function, args = downsample_tile, ([
+							(_path(level + 1, col * 2 + dx, row * 2 + dy), dx * tile_size / 2, dy * tile_size / 2)
+							for dy in (0, 1) for dx in (0, 1) if (col * 2 + dx < ccols) and (row * 2 + dy < crows)
+						], box[2], box[3])
+
+					if len(pending) >= jobs * 2:  # keep the amount of queued tile data small
+						done, pending = wait(pending, return_when=FIRST_COMPLETED)
+						for future in done:
+							future.result()
+					pending.add(pool.submit(write_tile, _path(level, col, row), function, args))
+
+			for future in pending:  # a level must be complete before the next lower one is composed from it
+				future.result()
+
+	image = xtree.Element('Image', {'xmlns':DZI_NS, 'Format':'png', 'Overlap':'0', 'TileSize':str(tile_size)})
+	xtree.SubElement(image, 'Size', {'Width':str(width), 'Height':str(height)})
+	with open(filename, 'w', encoding='utf-8') as f:
+		f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+		f.write(xtree.tostring(image, encoding='unicode'))
+
+
+def main():
+	"""One club to rule them all."""
+
+	ap = argparse.ArgumentParser(
+		description=('Drives the generators of the Macuahuitl toolbox for batch work on many artworks at once. Output is '
+			'generated in Scalable Vector Graphics (SVG) format and printed on the standard output stream.'),
+		epilog='Report bugs, request features, or provide suggestions via https://github.com/the-real-tokai/macuahuitl/issues',
+		add_help=False,
+	)
+
+	g = ap.add_argument_group('Startup')
+	g.add_argument('-V', '--version',   action='version',                  help="show version number and exit", version='%(prog)s {}'.format(__version__), )
+	g.add_argument('-h', '--help',      action='help',                     help='show this help message and exit')
+
+	sp = ap.add_subparsers(dest='command', metavar='COMMAND', title='Commands')
+	sp.required = True
+
+	cs = sp.add_parser('contact-sheet', add_help=False,
+		help='lay out variations of an artwork for a range of seeds in a single labeled grid',
+		description=('Generates variations of an artwork for a range of seeds on a process pool and lays them out in a single '
+			'labeled grid. Options following TOOL are passed on to the selected generator, f.ex. `--randomize\'.'),
+	)
+	g = cs.add_argument_group('Startup')
+	g.add_argument('-h', '--help',      action='help',                     help='show this help message and exit')
+	g = cs.add_argument_group('Contact Sheet')
+	g.add_argument('--seeds',           metavar='FIRST:LAST', type=seed_range, help='inclusive range of random seeds to generate variations for', required=True)
+	g.add_argument('--columns',         metavar='INT',        type=int,   help='number of grid columns; if omitted a roughly square grid is used')
+	g.add_argument('--cell-size',       metavar='FLOAT',      type=float, help='size of a single variation on the sheet  [:200.0]', default=200.0)
+	g.add_argument('--jobs',            metavar='INT',        type=int,   help='number of workers; if omitted all available cores are used')
+	g.add_argument('--backend',         choices=POOL_BACKENDS,            help='run the workers as processes or as threads; if omitted threads are used on free-threaded builds of Python, else processes')
+	g = cs.add_argument_group('Output')
+	g.add_argument('-o', '--output',    metavar='FILENAME',   type=str,   help='write the sheet into a file instead; files ending in ".png" are rasterized (requires the `svgcairo\' Python module)')
+	g.add_argument('--output-size',     metavar='INT',        type=int,   help='force pixel width of the raster image, height is automatically calculated; if omitted the generated SVG viewbox dimensions are used')
+	g = cs.add_argument_group('Generator')
+	g.add_argument('tool',              choices=TOOLS,                    help='generator to use')
+	g.add_argument('tool_args',         nargs=argparse.REMAINDER,         help='options for the generator', metavar='…')
+
+	ss = sp.add_parser('seed-search', add_help=False,
+		help='find the seeds of the best rated variations of an artwork without rendering them',
+		description=('Rates the variations of an artwork for a range of seeds on a process pool and prints the seeds of the '
+			'best ones with their score, one per line. Only the data needed for the rating is generated; supported are: '
+			'Temo (length of the best path through the maze). Options following TOOL are passed on to the selected '
+			'generator, f.ex. `--columns\' and `--rows\'.'),
+	)
+	g = ss.add_argument_group('Startup')
+	g.add_argument('-h', '--help',      action='help',                     help='show this help message and exit')
+	g = ss.add_argument_group('Seed Search')
+	g.add_argument('--seeds',           metavar='FIRST:LAST', type=seed_range, help='inclusive range of random seeds to rate the variations for', required=True)
+	g.add_argument('--top',             metavar='INT',        type=int,   help='number of best seeds to report  [:10]', default=10)
+	g.add_argument('--target',          metavar='INT',        type=int,   help='stop the search early once a variation reaches this score')
+	g.add_argument('--jobs',            metavar='INT',        type=int,   help='number of workers; if omitted all available cores are used')
+	g.add_argument('--backend',         choices=POOL_BACKENDS,            help='run the workers as processes or as threads; if omitted threads are used on free-threaded builds of Python, else processes')
+	g = ss.add_argument_group('Generator')
+	g.add_argument('tool',              choices=sorted(SEARCH_SCORES),    help='generator to use')
+	g.add_argument('tool_args',         nargs=argparse.REMAINDER,         help='options for the generator', metavar='…')
+
+	bp = sp.add_parser('batch', add_help=False,
+		help='write variations of an artwork for a range of seeds into separate files',
+		description=('Generates variations of an artwork for a range of seeds on a worker pool and writes each into its own '
+			'file. Options following TOOL are passed on to the selected generator, f.ex. `--randomize\'.'),
+	)
+	g = bp.add_argument_group('Startup')
+	g.add_argument('-h', '--help',      action='help',                     help='show this help message and exit')
+	g = bp.add_argument_group('Batch')
+	g.add_argument('--seeds',           metavar='FIRST:LAST', type=seed_range, help='inclusive range of random seeds to generate variations for', required=True)
+	g.add_argument('--jobs',            metavar='INT',        type=int,   help='number of workers; if omitted all available cores are used')
+	g.add_argument('--backend',         choices=POOL_BACKENDS,            help='run the workers as processes or as threads; if omitted threads are used on free-threaded builds of Python, else processes')
+	g.add_argument('--benchmark',       action='store_true',              help='instead of writing files generate the variations with each backend and print the wall-clock seconds they took')
+	g = bp.add_argument_group('Output')
+	g.add_argument('-o', '--output',    metavar='FILENAME',   type=str,   help='filename template; the `{seed}\' placeholder is replaced with the seed (else it is appended to the filename), files ending in ".png" are rasterized (requires the `svgcairo\' Python module)')
+	g = bp.add_argument_group('Generator')
+	g.add_argument('tool',              choices=TOOLS,                    help='generator to use')
+	g.add_argument('tool_args',         nargs=argparse.REMAINDER,         help='options for the generator', metavar='…')
+
+	dp = sp.add_parser('dataset', add_help=False,
+		help='rasterize variations of an artwork for a range of seeds into memory-mapped NumPy arrays',
+		description=('Rasterizes variations of an artwork for a range of seeds at a fixed pixel size on a worker pool, straight '
+			'into fixed-shape uint8 arrays in memory-mapped NumPy .npy shard files, f.ex. as training data. The generation '
+			'parameters of each sample are written into a JSON lines index file next to the shards. Options following TOOL '
+			'are passed on to the selected generator, f.ex. `--randomize\'.'),
+	)
+	g = dp.add_argument_group('Startup')
+	g.add_argument('-h', '--help',      action='help',                     help='show this help message and exit')
+	g = dp.add_argument_group('Dataset')
+	g.add_argument('--seeds',           metavar='FIRST:LAST', type=seed_range, help='inclusive range of random seeds to generate samples for', required=True)
+	g.add_argument('--size',            metavar=('WIDTH', 'HEIGHT'), type=int, nargs=2, help='pixel size of the samples; artworks of other aspect ratios are centered  [:256 256]', default=[256, 256])
+	g.add_argument('--shard-size',      metavar='INT',        type=int,   help='number of samples per shard file  [:1000]', default=1000)
+	g.add_argument('--jobs',            metavar='INT',        type=int,   help='number of workers; if omitted all available cores are used')
+	g.add_argument('--backend',         choices=POOL_BACKENDS,            help='run the workers as processes or as threads; if omitted threads are used on free-threaded builds of Python, else processes')
+	g = dp.add_argument_group('Output')
+	g.add_argument('-o', '--output',    metavar='FILENAME',   type=str,   help='filename template of the shards; the `{shard}\' placeholder is replaced with the shard number (else it is appended to the filename), the index file gets "index" and the ".jsonl" extension instead (requires the `svgcairo\' Python module)', required=True)
+	g = dp.add_argument_group('Generator')
+	g.add_argument('tool',              choices=TOOLS,                    help='generator to use')
+	g.add_argument('tool_args',         nargs=argparse.REMAINDER,         help='options for the generator', metavar='…')
+
+	user_input = ap.parse_args()
+
+	if user_input.command == 'dataset':
+		try:
+			write_dataset(user_input.tool, user_input.tool_args, user_input.seeds, os.path.realpath(os.path.expanduser(user_input.output)),
+				(max(1, user_input.size[0]), max(1, user_input.size[1])), shard_size=max(1, user_input.shard_size), backend=user_input.backend, jobs=user_input.jobs)
+		except ImportError as e:
+			print('Couldn\'t rasterize the samples. Required Python modules \'cairosvg\' and \'cairocffi\' are not available: {}'.format(str(e)), file=sys.stderr)
+		return
+
+	if user_input.command == 'batch':
+		if user_input.benchmark:
+			print('# Python {} ({}), {} jobs, {} variations'.format(sys.version.split()[0], 'GIL enabled' if gil_enabled() else 'free-threaded',
+				user_input.jobs if user_input.jobs else (os.cpu_count() or 1), len(user_input.seeds)))
+			for backend, seconds in benchmark_backends(user_input.tool, user_input.tool_args, user_input.seeds, jobs=user_input.jobs).items():
+				print('{}\t{:.3f}'.format(backend, seconds))
+		elif not user_input.output:
+			bp.error('the following arguments are required: -o/--output (or --benchmark)')
+		else:
+			try:
+				collections.deque(render_batch(user_input.tool, user_input.tool_args, user_input.seeds,
+					os.path.realpath(os.path.expanduser(user_input.output)), backend=user_input.backend, jobs=user_input.jobs), maxlen=0)
+			except ImportError as e:
+				print('Couldn\'t rasterize nor write the PNG files. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+		return
+
+	if user_input.command == 'seed-search':
+		for seed, score in seed_search(user_input.tool, user_input.tool_args, user_input.seeds,
+				top=max(1, user_input.top), target=user_input.target, jobs=user_input.jobs, backend=user_input.backend):
+			print('{}\t{}'.format(seed, score))
+		return
+
+	sheet, vbw, vbh = contact_sheet(user_input.tool, user_input.tool_args, user_input.seeds,
+		columns=user_input.columns, cell_size=user_input.cell_size, jobs=user_input.jobs, backend=user_input.backend)
+	rawxml = xtree.tostring(sheet, encoding='unicode')
+
+	if not user_input.output:
+		print(rawxml)
+	elif not user_input.output.lower().endswith('.png'):
+		with open(os.path.realpath(os.path.expanduser(user_input.output)), 'w', encoding='utf-8') as f:
+			f.write(rawxml)
+	else:
+		try:
+			write_png(rawxml, os.path.realpath(os.path.expanduser(user_input.output)), [user_input.output_size] if user_input.output_size else None, vbw, vbh)
+		except ImportError as e:
+			print('Couldn\'t rasterize nor write a PNG file. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+	main()
@@ -21,19 +21,28 @@
 
 	$Id: temo.py 164 2020-07-09 12:18:58Z tokai $
 """
+# pylint: disable=too-many-lines
 
 import random
 import argparse
+import bisect
 import math
+import json
 import sys
 import colorsys
 import logging
+import os
+import re
+from array import array
+from collections import Counter
 from enum import Enum
 import xml.etree.ElementTree as xtree
 
 __author__  = 'Christian Rosentreter'
 __version__ = '1.3'
-__all__     = []
+__all__     = ['parse_arguments', 'generate_data', 'generate', 'generate_plotter', 'geometry_parameters', 'estimate_cost', 'best_path_length', 'label_strokes', 'stroke_statistics']
+
+STYLE_OPTIONS = ('stroke_width', 'background_color', 'best_path_width', 'jobs', 'output', 'output_size', 'export', 'geometry_cache', 'dry_run', 'max_elements', 'max_seconds', 'max_output_bytes', 'deep_zoom', 'tile_size', 'plotter', 'stroke_stats')  # no influence on the generated data
 
 
 
@@ -52,9 +61,23 @@ class Slope(Enum):
 
 
 
+SLOPE_UP      = Slope.UP.value
+SLOPE_DOWN    = Slope.DOWN.value
+SLOPE_DIGITS  = bytes.maketrans(bytes((SLOPE_UP, SLOPE_DOWN)), b'01')
+
+# Tables for the top bytes of 32 bit random words: 1 where choice() of a slope takes the word, the
+# slope value it picks then, and the bytes of the words it skips.
+WORD_ACCEPTED = bytes(1 if b < 0x80 else 0 for b in range(0, 256))
+WORD_SLOPE    = bytes((b >> 6) & 1 for b in range(0, 256))
+WORD_REJECTED = bytes(range(0x80, 0x100))
+
+
+
 class DLine():
 	"""A diagonal line segment inside a square."""
 
+	__slots__ = ('slope', 'hue', 'x1', 'y1', 'x2', 'y2')
+
 	def __init__(self, slope, hue, x1, y1, x2, y2, angle=0):
 		self.slope = slope
 		self.hue   = hue
@@ -78,6 +101,47 @@ class DLine():
 		return '\\' if (self.slope == Slope.DOWN) else '/'
 
 
+class DLineRow():
+	"""A row of diagonal line segments kept compactly as arrays of slope values, hues, and coordinates; the segments are built on access."""
+
+	__slots__ = ('slopes', 'hues', 'points')
+
+	def __init__(self, slopes, hues, points):
+		self.slopes = slopes
+		self.hues   = hues
+		self.points = points
+
+	def __len__(self):
+		return len(self.slopes)
+
+	def __getitem__(self, x):
+		if isinstance(x, slice):
+			start, stop, _ = x.indices(len(self.slopes))
+			return DLineRow(self.slopes[start:stop], self.hues[start:stop], self.points[start * 4:stop * 4])
+		return next(iter(self[x:x + 1 or None]))
+
+	def __iter__(self):
+		slopes = tuple(Slope)
+		coords = iter(self.points)
+		for slope, hue, x1, y1, x2, y2 in zip(self.slopes, self.hues, coords, coords, coords, coords):
+			element       = DLine.__new__(DLine)
+			element.slope = slopes[slope]
+			element.hue   = hue
+			element.x1    = x1
+			element.y1    = y1
+			element.x2    = x2
+			element.y2    = y2
+			yield element
+
+
+def row_slopes(row):
+	"""Returns the slopes of a row of grid elements; the elements of compact rows aren't built for that."""
+	if isinstance(row, DLineRow):
+		slopes = tuple(Slope)
+		return [slopes[value] for value in row.slopes]
+	return [element.slope for element in row]
+
+
 def hue_blend(a, b):
 	"""Blends two angular hue values with linear interpolation."""
 	if a > b:
@@ -110,14 +174,50 @@ def lookup_hue(slope, x, y, rows, hue_shift_line):
 	return None
 
 
+def row_hue(slope, x, above, hues, hue_shift_line):
+	"""Looks up a hue value or a pair of hue values from the row above, given as slope values and hues; the same as lookup_hue() for compact rows."""
+	found = []
+	if above is not None:
+		if slope == SLOPE_DOWN:
+			if x and (above[x-1] == SLOPE_DOWN):
+				found.append(hues[x-1])
+			if above[x] == SLOPE_UP:
+				found.append(hues[x])
+		else:  # slope == SLOPE_UP
+			if above[x] == SLOPE_DOWN:
+				found.append(hues[x])
+			if (x < len(above) - 1) and (above[x+1] == SLOPE_UP):
+				found.append(hues[x+1])
+	if found:
+		if len(found) == 2:
+			return hue_blend(found[0], found[1])
+		return (found[0] + hue_shift_line) % 360
+	return None
+
+
+def fresh_cells(slopes, above, first=0):
+	"""Counts the grid elements of a row, from column 'first' on, that continue no line of the row above and so start a new hue.
+
+	Only the slope values of both rows are needed: they are turned into bit masks (bit x is set for a
+	"\\" slope in column x), so the whole row is checked with a few operations on integers.
+	"""
+	if above is None or not slopes:
+		return max(0, len(slopes) - first)
+	s    = int(bytes(reversed(slopes)).translate(SLOPE_DIGITS), 2)
+	a    = int(bytes(reversed(above)).translate(SLOPE_DIGITS), 2)
+	down = s & a & ~(a << 1)                                                            # "\" below a "\" with no "\" left of it
+	up   = ~s & ~a & ((a >> 1) | (1 << (len(slopes) - 1))) & ((1 << len(slopes)) - 1)  # "/" below a "/" with no "/" right of it
+	return bin((down | up) >> first).count('1')
+
+
 def hls_to_hex(hue, lightness, saturation):
 	"""Converts a HLS color triplet into a SVG hex string."""
 	return '#{:02x}{:02x}{:02x}'.format(*(int(c*255) for c in list(colorsys.hls_to_rgb(hue / 360, lightness, saturation))))
 
 
 
-def main():
-	"""It's not just a single line of code, but what can we do? :)"""
+def parse_arguments(args=None):
+	"""Sets up the command line interface and parses the supplied arguments."""
 
 	ap = argparse.ArgumentParser(
 		description=('Creates a colorful maze inspired by a famous one line C64 BASIC program '
@@ -144,7 +244,9 @@ def main():
 	g.add_argument('--background-color', metavar='COLOR',    type=str,   help='SVG compliant color specification or identifier; adds a background <rect> to the SVG output')
 	g.add_argument('--hue-shift',        metavar='FLOAT',    type=float, help='amount to rotate an imaginary color wheel before looking up new colors (in degrees)  [:15.0]', default=15.0)
 	g.add_argument('--hue-shift-line',   metavar='FLOAT',    type=float, help='separate hue shift for continuous lines; if not passed `--hue-shift\' applies too')
+	g.add_argument('--stroke-hues',      action='store_true',            help='color every connected stroke of the maze with a single hue, instead of following the lines from row to row; in previews strokes leaving the previewed rows may get other hues')
 	g.add_argument('--best-path-width',  metavar='FLOAT',    type=float, help='show the best (aka the longest) path through the maze and set width of its marker line')
+	g.add_argument('--jobs',             metavar='INT',      type=int,   help='number of worker processes to generate the maze in bands of rows and to render Deep Zoom tiles; 0 uses all available cores; the result is the same for any number  [:1]', default=1)
 
 	g = ap.add_argument_group('Schotter')
 	g.add_argument('--schotter-falloff',  choices=('infinite', 'horizontal', 'vertical', 'radial', 'box', 'random'),
@@ -155,90 +257,543 @@ def main():
 
 	g = ap.add_argument_group('Output')
 	g.add_argument('-o', '--output',    metavar='FILENAME', type=str,   help='optionally rasterize the generated vector paths and write the result into a PNG file (requires the `svgcairo\' Python module)')
-	g.add_argument('--output-size',     metavar='INT',      type=int,   help='force pixel width of the raster image, height is automatically calculated; if omitted the generated SVG viewbox dimensions are used')
+	g.add_argument('--output-size',     metavar='INT',      type=int,   nargs='+', help='force pixel width of the raster image, height is automatically calculated; if omitted the generated SVG viewbox dimensions are used; passing several sizes writes one PNG file for each, the `{size}\' placeholder in the filename is replaced with the size (else it is appended to the filename)')
+	g.add_argument('--export',          metavar='FILENAME', type=str,   help='write the generated shape data as typed columnar arrays into a binary file instead of printing SVG output')
+	g.add_argument('--geometry-cache',  metavar='DIR',      type=str,   help='reuse the generated layout of earlier runs with the same random seed and algorithm parameters from a cache directory, so changes of style only options are applied without generating everything again; requires --random-seed')
+	g.add_argument('--preview',         metavar='INT',      type=int,   nargs='?', const=24, help='quickly generate just the top left corner of INT×INT grid cells, laid out exactly as in the full maze; the best path is not shown  [:24]')
+	g.add_argument('--deep-zoom',       metavar='FILENAME', type=str,   help='write a Deep Zoom image (a .dzi descriptor and a pyramid of PNG tiles in a "_files" directory next to it) for pan and zoom viewers instead of printing SVG output; the pixel width of the full resolution is set by --output-size (requires the `svgcairo\' Python module)')
+	g.add_argument('--tile-size',       metavar='INT',      type=int,   help='pixel size of the Deep Zoom tiles  [:256]', default=256)
+	g.add_argument('--plotter',         metavar='INT',      type=int,   nargs='?', const=6, help='generate output for pen plotters: line segments meeting at cell corners are joined into polylines, which are sorted into one layer per pen (INT pens split the color wheel) and ordered to keep the pen-up travel short; the travel before and after is reported on the standard error stream  [:6]')
 
-	user_input = ap.parse_args()
+	g.add_argument('--stroke-stats',    action='store_true',           help='print the number of connected strokes and closed loops and statistics of the stroke lengths (in line segments) as JSON, without generating the maze')
 
-	# Generate data…
-	#
-	chaos      = random.Random(user_input.random_seed)
-	scale      = user_input.scale
-	frame      = user_input.frame
-	rows       = []
-	master_hue = chaos.uniform(0,360)
-	huesl      = user_input.hue_shift if user_input.hue_shift_line is None else user_input.hue_shift_line
+	from macuahuitl import add_limit_arguments
+	add_limit_arguments(ap)
+
+	return ap.parse_args(args)
+
+
+def geometry_parameters(user_input):
+	"""Returns the parts of the parsed user input with influence on the generated data, f.ex. to use as cache key."""
+	parameters = {k:v for k, v in vars(user_input).items() if k not in STYLE_OPTIONS}
+	parameters['best_path_width'] = bool(user_input.best_path_width)  # only the marker line width is a matter of style
+	parameters['version'] = __version__
+	return parameters
+
+
+def schotter_factor(user_input, x, y, chaos):
+	"""Returns the strength of the random displacement of the grid element at the given position."""
+
+	if user_input.schotter_falloff == 'infinite':
+		factor = 1.0
+	elif user_input.schotter_falloff == 'random':
+		factor = chaos.choice([0, 1.0])
+	elif user_input.schotter_falloff == 'vertical':
+		factor = 1.0 / (user_input.rows - 1) * y
+	elif user_input.schotter_falloff == 'horizontal':
+		factor = 1.0 / (user_input.columns - 1) * x
+	elif user_input.schotter_falloff == 'radial':
+		xc = (user_input.columns - 1) / 2.0
+		yc = (user_input.rows - 1) / 2.0
+		d  = math.sqrt(math.pow(xc - x, 2.0) + math.pow(yc - y, 2.0)) / 2.0
+		factor = 1.0 / max(xc, yc) * d
+	elif user_input.schotter_falloff == 'box':
+		md = min(x, (user_input.columns - 1) - x, y, (user_input.rows - 1) - y) * 2.0
+		factor = 1.0 / max(user_input.columns - 1, user_input.rows - 1) * md
+	else:
+		factor = 0
+
+	#if factor > 1.0:
+	#	print('WARNING: schotter_factor too big: {}'.format(factor), file=sys.stderr)
 
-	for y in range(0, user_input.rows):
-		# master_hue = (360 / user_input.rows * y) % 360
-		rows.append([])
+	if user_input.schotter_inverse:
+		factor = 1.0 - factor
+
+	#factor = -(math.cos(math.pi * factor) - 1.0) / 2.0  # ease-in-out-sine
+	return factor * factor # ease-in-quad
+
+
+def generate_element(user_input, x, y, chaos):
+	"""Generates the grid element at the given position; its hue is left for a later lookup."""
+	scale   = user_input.scale
+	frame   = user_input.frame
+	xoffset = 0
+	yoffset = 0
+	angle   = 0
+	slope   = chaos.choice([Slope.UP, Slope.DOWN])
+	factor  = schotter_factor(user_input, x, y, chaos)
+
+	if factor:
+		xoffset = chaos.uniform(-scale, scale) * factor * user_input.schotter_offset
+		yoffset = chaos.uniform(-scale, scale) * factor * user_input.schotter_offset
+		angle   = chaos.uniform(   -90,    90) * factor * user_input.schotter_rotation
+
+	return DLine(slope, None,
+		(x * scale + frame) + xoffset,
+		(y * scale + frame) + yoffset,
+		(x * scale + scale + frame) + xoffset,
+		(y * scale + scale + frame) + yoffset,
+		angle
+	)
+
+
+def generate_band(user_input, state, y1, y2):
+	"""Generates the grid elements of the rows y1 to y2 (exclusive) from the given random generator state.
+
+	The elements are returned compactly as their slope values and an array of their x1, y1, x2, y2
+	coordinates; pickling DLine objects on a worker process costs more than generating them.
+	"""
+	chaos  = random.Random()
+	chaos.setstate(state)
+	slopes = bytearray()
+	points = array('d')
+	for y in range(y1, y2):
 		for x in range(0, user_input.columns):
-			xoffset = 0
-			yoffset = 0
-			angle   = 0
-			slope   = chaos.choice([Slope.UP, Slope.DOWN])
+			element = generate_element(user_input, x, y, chaos)
+			slopes.append(element.slope.value)
+			points.extend((element.x1, element.y1, element.x2, element.y2))
+	return slopes, points
+
 
-			hue     = lookup_hue(slope, x, y, rows, huesl)
+def band_hues(user_input, slopes, above, master_hue):
+	"""Resolves the hues of the rows of a band from generate_band(), given the slope values of the row above it and the master hue at its first element.
+
+	The hues of the row above are not known yet, so the elements following its lines are left as NaN,
+	and so is every element following one of those. Their indices are returned with the hues, so the
+	main process resolves just them once the band above is done.
+	"""
+	columns    = user_input.columns
+	huesl      = user_input.hue_shift if user_input.hue_shift_line is None else user_input.hue_shift_line
+	hues       = array('d')
+	above_hues = [math.nan] * columns
+	for y in range(0, len(slopes), columns):
+		row       = slopes[y:y + columns]
+		row_hues  = []
+		for x, slope in enumerate(row):
+			hue = row_hue(slope, x, above, above_hues, huesl)
 			if hue is None:
-				hue = master_hue
+				hue        = master_hue
 				master_hue = (master_hue + user_input.hue_shift) % 360
+			row_hues.append(hue)
+		hues.extend(row_hues)
+		above, above_hues = row, row_hues
+	return hues, array('L', (i for i, hue in enumerate(hues) if math.isnan(hue)))
+
 
-			if user_input.schotter_falloff == 'infinite':
-				schotter_factor = 1.0
-			elif user_input.schotter_falloff == 'random':
-				schotter_factor = chaos.choice([0, 1.0])
-			elif user_input.schotter_falloff == 'vertical':
-				schotter_factor = 1.0 / (user_input.rows - 1) * y
-			elif user_input.schotter_falloff == 'horizontal':
-				schotter_factor = 1.0 / (user_input.columns - 1) * x
-			elif user_input.schotter_falloff == 'radial':
-				xc = (user_input.columns - 1) / 2.0
-				yc = (user_input.rows - 1) / 2.0
-				d  = math.sqrt(math.pow(xc - x, 2.0) + math.pow(yc - y, 2.0)) / 2.0
-				schotter_factor = 1.0 / max(xc, yc) * d
-			elif user_input.schotter_falloff == 'box':
-				md = min(x, (user_input.columns - 1) - x, y, (user_input.rows - 1) - y) * 2.0
-				schotter_factor = 1.0 / max(user_input.columns - 1, user_input.rows - 1) * md
+def generate_bands(user_input, chaos, master_hue, jobs):
+	"""Generates the rows of grid elements in bands on worker processes; returns them as DLineRow objects with resolved hues.
+
+	Each band starts from the exact random generator state the sequential generation would have at
+	its first row. To get there the main process quickly draws the same random numbers as a band
+	would (without building any geometry) while the previous bands are already worked on. The hues
+	of a band are resolved on a worker too, as soon as the master hue at its first element is known:
+	that just takes counting the elements of the bands above which start a new hue (fresh_cells()).
+	The main process then only stitches the bands together, resolving the elements of each band that
+	follow the lines of the band above it. Hues of whole strokes need all of the maze at once, so
+	they are assigned by the main process.
+	"""
+	from concurrent.futures import ProcessPoolExecutor
+	columns = user_input.columns
+	huesl   = user_input.hue_shift if user_input.hue_shift_line is None else user_input.hue_shift_line
+	bands   = min(user_input.rows, jobs * 4)
+	edges   = [user_input.rows * i // bands for i in range(0, bands + 1)]
+	results = []
+	rows    = []
+
+	with ProcessPoolExecutor(max_workers=jobs) as pool:
+		futures = []
+		for y1, y2 in zip(edges, edges[1:]):
+			futures.append(pool.submit(generate_band, user_input, chaos.getstate(), y1, y2))
+			if user_input.schotter_falloff or user_input.schotter_inverse:
+				draw_slopes(user_input, chaos, y1, y2)
+			else:
+				draw_slope_values(chaos, (y2 - y1) * columns)
+
+		above = None
+		for future in futures:
+			slopes, points = future.result()
+			results.append((slopes, points, None if user_input.stroke_hues else pool.submit(band_hues, user_input, slopes, above, master_hue)))
+			if not user_input.stroke_hues:
+				for y in range(0, len(slopes), columns):
+					for _ in range(0, fresh_cells(slopes[y:y + columns], above)):
+						master_hue = (master_hue + user_input.hue_shift) % 360
+					above = slopes[y:y + columns]
+			above = slopes[-columns:]
+
+		above, above_hues = None, None
+		for slopes, points, hues in results:
+			if hues is None:
+				hues = array('d', bytes(8 * len(slopes)))
+			else:
+				hues, unresolved = hues.result()
+				row = 0
+				for i in unresolved:
+					y, x = divmod(i, columns)
+					if y != row:  # the row above is resolved already
+						row        = y
+						above      = slopes[(y - 1) * columns:y * columns]
+						above_hues = hues[(y - 1) * columns:y * columns]
+					hues[i] = row_hue(slopes[i], x, above, above_hues, huesl)
+			for y in range(0, len(slopes), columns):
+				rows.append(DLineRow(slopes[y:y + columns], hues[y:y + columns], points[y * 4:(y + columns) * 4]))
+			above, above_hues = rows[-1].slopes, rows[-1].hues
+
+	if user_input.stroke_hues:
+		labels, _ = label_strokes([row_slopes(row) for row in rows])
+		hues      = {}
+		for i, label in enumerate(labels):
+			if label not in hues:
+				hues[label] = master_hue
+				master_hue  = (master_hue + user_input.hue_shift) % 360
+			rows[i // columns].hues[i % columns] = hues[label]
+
+	return rows
+
+
+def draw_slopes(user_input, chaos, y1, y2, x1=0):
+	"""Draws just the slopes of the rows y1 to y2 (exclusive), advancing the random generator the same way generate_element() does."""
+	slopes = []
+	lookup = tuple(Slope)
+	if not (user_input.schotter_falloff or user_input.schotter_inverse):  # no displacement, so no further random numbers
+		for y in range(y1, y2):
+			slopes.append([lookup[value] for value in draw_slope_values(chaos, user_input.columns - x1)])
+		return slopes
+	for y in range(y1, y2):
+		slopes.append([])
+		for x in range(x1, user_input.columns):
+			slope = chaos.getrandbits(2)  # same as choice() of a slope: the top bits of 32 bit words until one is below 2
+			while slope > 1:
+				slope = chaos.getrandbits(2)
+			slopes[-1].append(lookup[slope])
+			if schotter_factor(user_input, x, y, chaos):
+				chaos.getrandbits(192)  # same as the three uniform() calls in generate_element(): 6 × 32 bits
+	return slopes
+
+
+def draw_slope_values(chaos, count):
+	"""Draws the slopes of 'count' grid elements without any displacement in bulk; returns their values.
+
+	Every choice() of a slope takes 32 bit words until one with the highest bit clear turns up, and
+	its next bit picks the slope. So the words are drawn in bulk, the slopes are taken from the words
+	with the highest bit clear, and the position of the last needed one is looked up among them; then
+	just that many words are drawn again from the saved state.
+	"""
+	values = bytearray()
+	while count > 0:
+		state = chaos.getstate()
+		words = 2 * count + 64
+		top   = chaos.getrandbits(32 * words).to_bytes(4 * words, 'little')[3::4]
+		flags = top.translate(WORD_ACCEPTED)
+		found = flags.count(1)
+		if found < count:
+			values += top.translate(WORD_SLOPE, WORD_REJECTED)
+			count  -= found
+			continue
+		lo, hi = count, words  # smallest prefix of the words with 'count' accepted ones
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if flags.count(1, 0, mid) < count:
+				lo = mid + 1
 			else:
-				schotter_factor = 0
+				hi = mid
+		chaos.setstate(state)
+		chaos.getrandbits(32 * lo)
+		values += top[:lo].translate(WORD_SLOPE, WORD_REJECTED)
+		count   = 0
+	return values
+
+
+def border_positions(columns, rows):
+	"""Returns all positions right outside the grid, with the direction leading into the grid."""
+	coords = []
+	for x in range(0, columns):
+		coords.append((x, -1, Direction.SOUTH))
+		coords.append((x, rows, Direction.NORTH))
+	for y in range(0, rows):
+		coords.append((-1, y, Direction.EAST))
+		coords.append((columns, y, Direction.WEST))
+	return coords
+
+
+def walk(slopes, wx, wy, wd):
+	"""Follows a path from a position outside the grid through the maze until it leaves the grid again.
+
+	Returns the list of diagonal (tx, ty) steps and the exit, the position outside the grid from
+	where the same path is walked in reverse.
+	"""
+	rows    = len(slopes)
+	columns = len(slopes[0])
+	steps   = []
+	debug   = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+	while True:
+		if wd == Direction.SOUTH:
+			wy += 1
+			if wy >= rows:
+				return steps, (wx, wy, Direction.NORTH)
+			wd, tx, ty = (Direction.EAST, 1, 1) if (slopes[wy][wx] == Slope.DOWN) else (Direction.WEST, -1, 1)
+		elif wd == Direction.WEST:
+			wx -= 1
+			if wx < 0:
+				return steps, (wx, wy, Direction.EAST)
+			wd, tx, ty = (Direction.NORTH, -1, -1) if (slopes[wy][wx] == Slope.DOWN) else (Direction.SOUTH, -1, 1)
+		elif wd == Direction.EAST:
+			wx += 1
+			if wx >= columns:
+				return steps, (wx, wy, Direction.WEST)
+			wd, tx, ty = (Direction.SOUTH, 1, 1) if (slopes[wy][wx] == Slope.DOWN) else (Direction.NORTH, 1, -1)
+		else:  # wd == Direction.NORTH
+			wy -= 1
+			if wy < 0:
+				return steps, (wx, wy, Direction.SOUTH)
+			wd, tx, ty = (Direction.WEST, -1, -1) if (slopes[wy][wx] == Slope.DOWN) else (Direction.EAST, 1, -1)
+
+		steps.append((tx, ty))
+		if debug:
+			logging.debug('New position <%u×%u>, direction <%s>', wx, wy, wd)
+
+
+def best_path_length(user_input):
+	"""Returns the number of steps of the best (aka the longest) path through the maze.
+
+	Only the slopes are drawn from the random generator, hues, schotter geometry, and SVG data are
+	skipped entirely, so this is a cheap measure to search for seeds with long paths.
+	"""
+	columns = max(0, user_input.columns)
+	rows    = max(0, user_input.rows)
+	chaos   = random.Random(user_input.random_seed)
+	chaos.uniform(0, 360)  # master hue
+	if user_input.schotter_falloff or user_input.schotter_inverse:
+		slopes = bytes(slope.value for row in draw_slopes(user_input, chaos, 0, rows) for slope in row)
+	else:
+		slopes = draw_slope_values(chaos, columns * rows)
+	return longest_walk(slopes, columns, rows)
+
+
+def longest_walk(slopes, columns, rows):
+	"""Returns the number of steps of the longest path through a maze given as flat, row-major slope values.
 
-			#if schotter_factor > 1.0:
-			#	print('WARNING: schotter_factor too big: {}'.format(schotter_factor), file=sys.stderr)
+	The paths are the same ones walk() follows, with the directions as plain indices into lookup
+	tables; every path is walked just once, as the reverse walk from its exit is skipped.
+	"""
+	dx      = (0, -1, 1, 0)                     # south, west, east, north
+	dy      = (1, 0, 0, -1)
+	turn    = (1, 2, 0, 3, 3, 0, 2, 1)          # new direction for each direction and slope value ("/", "\")
+	reverse = (3, 2, 1, 0)
+	starts  = [(x, -1, 0) for x in range(0, columns)] + [(x, rows, 3) for x in range(0, columns)]
+	starts += [(-1, y, 2) for y in range(0, rows)] + [(columns, y, 1) for y in range(0, rows)]
+	best    = 0
+	walked  = set()
 
-			if user_input.schotter_inverse:
-				schotter_factor = 1.0 - schotter_factor
+	for x, y, d in starts:
+		if (x, y, d) in walked:
+			continue
+		steps = 0
+		while True:
+			x += dx[d]
+			y += dy[d]
+			if not (0 <= x < columns and 0 <= y < rows):
+				break
+			d      = turn[d * 2 + slopes[y * columns + x]]
+			steps += 1
+		walked.add((x, y, reverse[d]))
+		best = max(best, steps)
+
+	return best
+
+
+def label_strokes(slopes):
+	"""Labels the connected strokes of the maze in one pass over its slopes; returns the label of each cell (row-major) and the number of closed loops.
+
+	The lines are the edges of a graph of the cell corners, connected with a union-find over the
+	corners; the label of a cell is the representative corner of its stroke. As every cell has one
+	line, the independent closed loops are the edges minus the touched corners plus the strokes.
+	"""
+	rows    = len(slopes)
+	width   = (len(slopes[0]) if rows else 0) + 1
+	parent  = list(range(width * (rows + 1)))
+	touched = bytearray(width * (rows + 1))
+	corners = []
+
+	def _find(i):
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]  # path halving
+			i = parent[i]
+		return i
+
+	for y, row in enumerate(slopes):
+		for x, slope in enumerate(row):
+			if slope == Slope.DOWN:
+				a, b = y * width + x, (y + 1) * width + x + 1
+			else:
+				a, b = y * width + x + 1, (y + 1) * width + x
+			ra, rb = _find(a), _find(b)
+			if ra != rb:
+				parent[ra] = rb
+			touched[a] = touched[b] = 1
+			corners.append(a)
+
+	labels = [_find(c) for c in corners]
+	return labels, len(labels) - sum(touched) + len(set(labels))
+
+
+def stroke_statistics(user_input):
+	"""Returns the number of connected strokes and closed loops of the maze, and statistics of the stroke lengths in line segments.
+
+	Like best_path_length() only the slopes are drawn from the random generator, so this is cheap
+	enough to filter many seeds.
+	"""
+	chaos = random.Random(user_input.random_seed)
+	chaos.uniform(0, 360)  # master hue
+	labels, loops = label_strokes(draw_slopes(user_input, chaos, 0, user_input.rows))
+	lengths = sorted(Counter(labels).values())
+
+	return {
+		'strokes':  len(lengths),
+		'loops':    loops,
+		'shortest': lengths[0] if lengths else 0,
+		'longest':  lengths[-1] if lengths else 0,
+		'mean':     round(sum(lengths) / len(lengths), 3) if lengths else 0,
+		'median':   lengths[len(lengths) // 2] if lengths else 0,
+	}
+
+
+def estimate_cost(user_input):
+	"""Estimates the number of shape elements, run time, and output size for the parsed user input; nothing is generated.
+
+	Run time and size per grid element were measured with the default parameters, the best path adds
+	walking every path through the maze.
+	"""
+	columns = max(0, user_input.columns)
+	rows    = max(0, user_input.rows)
+	vbw     = max(1, int((user_input.scale * columns) + (user_input.frame * 2.0)))
+	vbh     = max(1, int((user_input.scale * rows   ) + (user_input.frame * 2.0)))
+	cells   = columns * rows
+	seconds = cells * 25e-6
+
+	if user_input.preview:
+		cells   = min(columns, user_input.preview) * min(rows, user_input.preview)
+		seconds = cells * 25e-6 + (min(rows, user_input.preview) * columns - cells) * (3e-6 if user_input.schotter_falloff else 3e-7)
+	elif user_input.best_path_width:
+		seconds += cells * 1e-6
+
+	svg_bytes = cells * (135 if user_input.schotter_falloff else 87)
+
+	return {
+		'elements':     cells + 4,
+		'seconds':      round(seconds, 3),
+		'output_bytes': sum(w * max(1, int(w * vbh / vbw)) * 4 for w in (user_input.output_size or [vbw])) if user_input.output else int(svg_bytes),
+	}
+
+
+def preview_hues(user_input, rows, slopes, master_hue):
+	"""Resolves the hues of the previewed corner of the maze; 'slopes' holds the slope values of the full rows of the preview.
+
+	The hue of an element follows the elements above and up to one column left or right of it, so
+	the corner depends on the hues of a triangle of elements right of it. Further right the elements
+	are only counted as far as they start new hues, as each of those advances the master hue.
+	"""
+	huesl   = user_input.hue_shift if user_input.hue_shift_line is None else user_input.hue_shift_line
+	columns = user_input.columns
+
+	if user_input.stroke_hues:
+		labels, _ = label_strokes([[Slope(value) for value in row] for row in slopes])
+		hues      = {}
+		for i, label in enumerate(labels):
+			if label not in hues:
+				hues[label] = master_hue
+				master_hue  = (master_hue + user_input.hue_shift) % 360
+			if i % columns < len(rows[i // columns]):
+				rows[i // columns][i % columns].hue = hues[label]
+		return
+
+	above, hues = None, None
+	for y, row in enumerate(slopes):
+		width       = min(columns, len(rows[y]) + len(slopes) - 1 - y)
+		above_hues  = hues
+		hues        = []
+		for x in range(0, width):
+			hue = row_hue(row[x], x, above, above_hues, huesl)
+			if hue is None:
+				hue        = master_hue
+				master_hue = (master_hue + user_input.hue_shift) % 360
+			hues.append(hue)
+		for _ in range(0, fresh_cells(row, above, width)):
+			master_hue = (master_hue + user_input.hue_shift) % 360
+		for element, hue in zip(rows[y], hues):
+			element.hue = hue
+		above = row
 
-			#schotter_factor = -(math.cos(math.pi * schotter_factor) - 1.0) / 2.0  # ease-in-out-sine
-			schotter_factor = schotter_factor * schotter_factor # ease-in-quad
 
-			if schotter_factor:
-				xoffset = chaos.uniform(-scale, scale) * schotter_factor * user_input.schotter_offset
-				yoffset = chaos.uniform(-scale, scale) * schotter_factor * user_input.schotter_offset
-				angle   = chaos.uniform(   -90,    90) * schotter_factor * user_input.schotter_rotation
+def resolve_hues(user_input, rows, master_hue):
+	"""Resolves the hues of the generated rows of grid elements.
 
-			rows[y].append(DLine(slope, hue,
-				(x * scale + frame) + xoffset,
-				(y * scale + frame) + yoffset,
-				(x * scale + scale + frame) + xoffset,
-				(y * scale + scale + frame) + yoffset,
-				angle
-			))
+	Hues follow the lines from the previous row, so they are resolved in a second, sequential pass.
+	"""
+	huesl = user_input.hue_shift if user_input.hue_shift_line is None else user_input.hue_shift_line
+
+	if user_input.stroke_hues:
+		labels, _ = label_strokes([[element.slope for element in row] for row in rows])
+		hues      = {}
+		for element, label in zip((element for row in rows for element in row), labels):
+			if label not in hues:
+				hues[label] = master_hue
+				master_hue  = (master_hue + user_input.hue_shift) % 360
+			element.hue = hues[label]
+	else:
+		for y, row in enumerate(rows):
+			# master_hue = (360 / user_input.rows * y) % 360
+			for x, element in enumerate(row):
+				element.hue = lookup_hue(element.slope, x, y, rows, huesl)
+				if element.hue is None:
+					element.hue = master_hue
+					master_hue  = (master_hue + user_input.hue_shift) % 360
+
+
+def generate_data(user_input):
+	"""Generates the maze elements and the optional best path from the parsed user input."""
+
+	# Generate data…
+	#
+	chaos      = random.Random(user_input.random_seed)
+	scale      = user_input.scale
+	frame      = user_input.frame
+	rows       = []
+	master_hue = chaos.uniform(0,360)
+
+	jobs       = user_input.jobs if user_input.jobs else (os.cpu_count() or 1)
+
+	if user_input.preview:
+		# Only the top left corner is generated. The remaining cells of its rows just get their slopes
+		# drawn, as the random numbers have to stay in sync and the hues depend on them.
+		view_columns = min(user_input.columns, user_input.preview)
+		slopes       = []
+		for y in range(0, min(user_input.rows, user_input.preview)):
+			rows.append([generate_element(user_input, x, y, chaos) for x in range(0, view_columns)])
+			if user_input.schotter_falloff or user_input.schotter_inverse:
+				tail = bytes(slope.value for slope in draw_slopes(user_input, chaos, y, y + 1, view_columns)[0])
+			else:
+				tail = draw_slope_values(chaos, user_input.columns - view_columns)
+			slopes.append(bytes(element.slope.value for element in rows[y]) + tail)
+		preview_hues(user_input, rows, slopes, master_hue)
+	elif jobs > 1 and user_input.rows > 1 and user_input.columns > 0:
+		rows = generate_bands(user_input, chaos, master_hue, jobs)
+	else:
+		for y in range(0, user_input.rows):
+			rows.append([generate_element(user_input, x, y, chaos) for x in range(0, user_input.columns)])
+		resolve_hues(user_input, rows, master_hue)
 
 	# Primitive path walking…
 	#
 	bestwalker = None
 	circle_pos = None
 
-	if user_input.best_path_width:
-		coords = []
-		for x in range(0, user_input.columns):
-			coords.append((x, -1, Direction.SOUTH))
-			coords.append((x, user_input.rows, Direction.NORTH))
-		for y in range(0, user_input.rows):
-			coords.append((-1, y, Direction.EAST))
-			coords.append((user_input.columns, y, Direction.WEST))
+	if user_input.best_path_width and not user_input.preview:
+		coords = border_positions(user_input.columns, user_input.rows)
 		chaos.shuffle(coords)
 
 		offset = scale / 2.0
+		slopes = [row_slopes(row) for row in rows]
 
 		for pos in coords:
 			wx, wy, wd = pos
@@ -248,42 +803,39 @@ def main():
 				'v' if wd in (Direction.SOUTH, Direction.NORTH) else 'h',
 				offset if wd in (Direction.SOUTH, Direction.EAST) else -offset
 			)]
-			tx, ty = 1, 1
-
-			while True:
-				if wd == Direction.SOUTH:
-					wy += 1
-					if wy >= user_input.rows:
-						break
-					wd, tx, ty = (Direction.EAST, 1, 1) if (rows[wy][wx].slope == Slope.DOWN) else (Direction.WEST, -1, 1)
-				elif wd == Direction.WEST:
-					wx -= 1
-					if wx < 0:
-						break
-					wd, tx, ty = (Direction.NORTH, -1, -1) if (rows[wy][wx].slope == Slope.DOWN) else (Direction.SOUTH, -1, 1)
-				elif wd == Direction.EAST:
-					wx += 1
-					if wx >= user_input.columns:
-						break
-					wd, tx, ty = (Direction.SOUTH, 1, 1) if (rows[wy][wx].slope == Slope.DOWN) else (Direction.NORTH, 1, -1)
-				else:  # wd == Direction.NORTH
-					wy -= 1
-					if wy < 0:
-						break
-					wd, tx, ty = (Direction.WEST, -1, -1) if (rows[wy][wx].slope == Slope.DOWN) else (Direction.EAST, 1, -1)
-
+			steps, _ = walk(slopes, wx, wy, wd)
+			for tx, ty in steps:
 				tempwalker.append('l{} {}'.format((offset * tx), (offset * ty)))
-				logging.debug('New position <%u×%u>, direction <%s>', wx, wy, wd)
 
 			logging.debug(tempwalker)
 			if bestwalker is None or len(tempwalker) > len(bestwalker):
 				bestwalker = tempwalker.copy()
 				circle_pos = (cx, cy)
 
+	columns = len(rows[0]) if rows else 0
+	vbw = int((scale * columns  ) + (frame * (2.0 if columns == user_input.columns else 1.0)))
+	vbh = int((scale * len(rows)) + (frame * (2.0 if len(rows) == user_input.rows else 1.0)))
+
+	return {'chaos':chaos, 'rows':rows, 'bestwalker':bestwalker, 'circle_pos':circle_pos, 'vbw':vbw, 'vbh':vbh}
+
+
+def generate(user_input, data=None):
+	"""Generates the maze from the parsed user input, or from already generated data; returns the SVG root element and its viewbox size."""
+
+	if data is None:
+		data = generate_data(user_input)
+	if user_input.plotter:
+		return generate_plotter(user_input, data)[:3]
+
+	chaos      = data['chaos']
+	rows       = data['rows']
+	bestwalker = data['bestwalker']
+	circle_pos = data['circle_pos']
+	vbw        = data['vbw']
+	vbh        = data['vbh']
+
 	# Generate SVG…
 	#
-	vbw = int((scale * user_input.columns) + (frame * 2.0))
-	vbh = int((scale * user_input.rows   ) + (frame * 2.0))
 
 	svg = xtree.Element('svg', {'width':'100%', 'height':'100%', 'xmlns':'http://www.w3.org/2000/svg', 'viewBox':'0 0 {} {}'.format(vbw, vbh)})
 	title = xtree.SubElement(svg, 'title')
@@ -323,24 +875,341 @@ def main():
 			'fill': wcolor,
 		})
 
-	rawxml = xtree.tostring(svg, encoding='unicode')
+	return svg, vbw, vbh
 
-	# Output…
-	#
-	if not user_input.output:
-		print(rawxml)
-	else:
+
+def plotter_strokes(user_input, rows, pens):
+	"""Joins the maze lines into polylines, separately for the lines of each pen; returns a list of polylines for each pen.
+
+	A line runs from one corner of its grid cell to the opposite one, so the slopes define which lines
+	meet at a corner, the same way they define the corridors walk() follows. Each line is looked up
+	by its corners, and the polylines are grown from corners with an odd number of lines first. Lines
+	displaced by schottering don't meet their neighbors anymore and become polylines of their own.
+	"""
+	scale   = user_input.scale
+	frame   = user_input.frame
+	edges   = [[] for _ in range(pens)]
+	strokes = [[] for _ in range(pens)]
+
+	for y, row in enumerate(rows):
+		for x, e in enumerate(row):
+			pen = int(((e.hue + 180.0 / pens) % 360) * pens / 360) % pens
+			c1, c2 = ((x, y), (x + 1, y + 1)) if e.slope == Slope.DOWN else ((x + 1, y), (x, y + 1))
+			if max(abs(e.x1 - (c1[0] * scale + frame)), abs(e.y1 - (c1[1] * scale + frame)),
+					abs(e.x2 - (c2[0] * scale + frame)), abs(e.y2 - (c2[1] * scale + frame))) < scale * 1e-9:
+				edges[pen].append((c1, c2, (e.x1, e.y1), (e.x2, e.y2)))
+			else:
+				strokes[pen].append([(e.x1, e.y1), (e.x2, e.y2)])
+
+	for pen in range(pens):
+		corners = {}
+		for i, (c1, c2, _, _) in enumerate(edges[pen]):
+			corners.setdefault(c1, []).append(i)
+			corners.setdefault(c2, []).append(i)
+		used = [False] * len(edges[pen])
+		order = [c for c, lines in corners.items() if len(lines) % 2] + [c for c, lines in corners.items() if not len(lines) % 2]  # odd ones first
+
+		for corner in order:
+			while corners[corner]:
+				stroke, at = None, corner
+				while corners[at]:
+					i = corners[at].pop()
+					if used[i]:
+						continue
+					used[i] = True
+					c1, c2, p1, p2 = edges[pen][i]
+					if stroke is None:
+						stroke = [p1 if at == c1 else p2]
+					stroke.append(p2 if at == c1 else p1)
+					at = c2 if at == c1 else c1
+				if stroke:
+					strokes[pen].append(stroke)
+
+	return strokes
+
+
+def order_strokes(strokes, cell, start=(0.0, 0.0)):
+	"""Orders polylines (reversing them as needed) to keep the pen-up travel short; returns them and the end position.
+
+	A nearest neighbor heuristic: the next polyline is the one with the closest end point (of several
+	as close, the one listed first). The end points are kept in the buckets of a uniform grid, along
+	with sorted lists of the rows holding any and of the occupied columns of each row. Unless one of
+	the cells around the current position holds an end point less than a cell away, the search walks
+	outward through those lists until the rows and columns left are farther away than the closest end
+	point found, so it skips the parts of the grid already drawn.
+	"""
+	def _cell(point):
+		return int(point[0] // cell), int(point[1] // cell)
+
+	def _gap(c, p):  # distance of a coordinate to the span of a grid row or column
+		return max(0.0, c * cell - p, p - (c + 1) * cell)
+
+	grid = {}
+	for i, stroke in enumerate(strokes):
+		grid.setdefault(_cell(stroke[0]), set()).add((i, 0))
+		grid.setdefault(_cell(stroke[-1]), set()).add((i, 1))
+	if not grid:
+		return [], start
+	occupied = {}
+	for cx, cy in grid:
+		occupied.setdefault(cy, []).append(cx)
+	for columns in occupied.values():
+		columns.sort()
+	rows = sorted(occupied)
+
+	def _search(best, pos, cy, dy):
+		columns = occupied[cy]
+		right   = bisect.bisect_left(columns, int(pos[0] // cell))
+		for indices in (range(right - 1, -1, -1), range(right, len(columns))):
+			for j in indices:
+				x = columns[j] * cell
+				if math.hypot(max(0.0, x - pos[0], pos[0] - x - cell), dy) > best[0]:
+					break  # all columns further in this direction are farther away
+				for i, end in grid[(columns[j], cy)]:
+					point = strokes[i][-1 if end else 0]
+					best  = min(best, (math.hypot(point[0] - pos[0], point[1] - pos[1]), i, end))
+		return best
+
+	ordered = []
+	pos     = start
+	for _ in range(len(strokes)):
+		best   = (math.inf, -1, 0)  # distance, polyline, and which of its ends
+		px, py = _cell(pos)
+		for cx, cy in ((px - 1, py - 1), (px, py - 1), (px + 1, py - 1), (px - 1, py), (px, py), (px + 1, py), (px - 1, py + 1), (px, py + 1), (px + 1, py + 1)):
+			for i, end in grid.get((cx, cy), ()):
+				point = strokes[i][-1 if end else 0]
+				best  = min(best, (math.hypot(point[0] - pos[0], point[1] - pos[1]), i, end))
+
+		down = bisect.bisect_left(rows, py)
+		up   = down - 1
+		while (best[0] >= cell) and ((up >= 0) or (down < len(rows))):  # cells beyond the neighbors are at least a cell away
+			gap_up   = _gap(rows[up], pos[1]) if up >= 0 else math.inf
+			gap_down = _gap(rows[down], pos[1]) if down < len(rows) else math.inf
+			if min(gap_up, gap_down) > best[0]:
+				break  # all rows left are farther away
+			if gap_up <= gap_down:
+				best = _search(best, pos, rows[up], gap_up)
+				up  -= 1
+			else:
+				best = _search(best, pos, rows[down], gap_down)
+				down += 1
+
+		_, i, end = best
+		for e, point in ((0, strokes[i][0]), (1, strokes[i][-1])):
+			key    = _cell(point)
+			bucket = grid[key]
+			bucket.discard((i, e))
+			if not bucket:
+				del grid[key]
+				columns = occupied[key[1]]
+				del columns[bisect.bisect_left(columns, key[0])]
+				if not columns:
+					del occupied[key[1]]
+					del rows[bisect.bisect_left(rows, key[1])]
+		stroke = strokes[i][::-1] if end else strokes[i]
+		ordered.append(stroke)
+		pos = stroke[-1]
+
+	return ordered, pos
+
+
+def travel_distance(strokes, start=(0.0, 0.0)):
+	"""Returns the pen-up travel to draw the polylines in the given order, starting at the given position."""
+	distance = 0.0
+	for stroke in strokes:
+		distance += math.hypot(stroke[0][0] - start[0], stroke[0][1] - start[1])
+		start     = stroke[-1]
+	return distance
+
+
+def generate_plotter(user_input, data=None):
+	"""Generates the maze for pen plotters, with joined and ordered polylines in one group per pen.
+
+	Returns the SVG root element, its viewbox size, and the pen-up travel of the plain row-major order
+	of the lines and of the ordered polylines.
+	"""
+	if data is None:
+		data = generate_data(user_input)
+
+	rows  = data['rows']
+	vbw   = data['vbw']
+	vbh   = data['vbh']
+	pens  = max(1, user_input.plotter)
+	pos   = (0.0, 0.0)
+	after = 0.0
+
+	svg = xtree.Element('svg', {'width':'100%', 'height':'100%', 'xmlns':'http://www.w3.org/2000/svg', 'viewBox':'0 0 {} {}'.format(vbw, vbh)})
+	title = xtree.SubElement(svg, 'title')
+	title.text = 'A Temo Artwork'
+
+	if user_input.background_color:
+		xtree.SubElement(svg, 'rect', {'id':'background', 'x':'0', 'y':'0', 'width':str(vbw), 'height':str(vbh), 'fill':user_input.background_color})
+
+	for pen, strokes in enumerate(plotter_strokes(user_input, rows, pens)):
+		strokes, end = order_strokes(strokes, user_input.scale, pos)
+		after += travel_distance(strokes, pos)
+		pos    = end
+		if strokes:
+			svg_g = xtree.SubElement(svg, 'g', {'id':'pen-{}'.format(pen + 1), 'stroke':hls_to_hex(pen * 360.0 / pens, 0.6, 0.5), 'stroke-width':str(user_input.stroke_width), 'stroke-linecap':'round', 'stroke-linejoin':'round', 'fill':'none'})
+			for stroke in strokes:
+				xtree.SubElement(svg_g, 'path', {'d':'M' + 'L'.join('{} {}'.format(x, y) for x, y in stroke)})
+
+	if data['bestwalker']:
+		svg_g = xtree.SubElement(svg, 'g', {'id':'best_walker'})
+		xtree.SubElement(svg_g, 'path', {
+			'd':               ''.join(data['bestwalker']),
+			'stroke-width':    str(user_input.best_path_width),
+			'stroke':          hls_to_hex(data['chaos'].uniform(0, 360), 0.5, 0.8),
+			'stroke-linecap':  'round',
+			'stroke-linejoin': 'round',
+			'fill':            'none',
+		})
+
+	before = travel_distance([[(e.x1, e.y1), (e.x2, e.y2)] for row in rows for e in row])
+	return svg, vbw, vbh, (before, after)
+
+
+def best_path_pieces(bestwalker):
+	"""Converts the SVG path data of the best path into a list of straight (x1, y1, x2, y2) pieces."""
+	x, y, d, offset = re.match(r'M(\S+) (\S+?)([vh])(\S+)$', bestwalker[0]).groups()
+	x, y, offset    = float(x), float(y), float(offset)
+	pieces = [(x, y, x, y + offset) if d == 'v' else (x, y, x + offset, y)]
+	for step in bestwalker[1:]:
+		x, y = pieces[-1][2:]
+		tx, ty = (float(v) for v in step[1:].split(' '))
+		pieces.append((x, y, x + tx, y + ty))
+	return pieces
+
+
+def render_tile(user_input, box, lines, path, size):
+	"""Rasterizes the maze lines and best path pieces inside a box of the viewbox into a PNG tile of the given size; returns the PNG data.
+
+	The 'path' holds the best path pieces, the circle at its end (if inside), and their color.
+	"""
+	from cairosvg import svg2png
+
+	pieces, circle, wcolor = path
+	width, height          = size
+
+	svg = xtree.Element('svg', {'width':str(width), 'height':str(height), 'xmlns':'http://www.w3.org/2000/svg', 'viewBox':'{} {} {} {}'.format(*box)})
+
+	if user_input.background_color:
+		xtree.SubElement(svg, 'rect', {'x':str(box[0]), 'y':str(box[1]), 'width':str(box[2]), 'height':str(box[3]), 'fill':user_input.background_color})
+	svg_g = xtree.SubElement(svg, 'g', {'stroke-width':str(user_input.stroke_width), 'stroke-linecap':'round'})
+
+	for x1, y1, x2, y2, hue in lines:
+		xtree.SubElement(svg_g, 'line', {'x1':str(x1), 'y1':str(y1), 'x2':str(x2), 'y2':str(y2), 'stroke':hls_to_hex(hue, 0.6, 0.5)})
+
+	if pieces or circle:
+		svg_g = xtree.SubElement(svg, 'g', {'stroke-width':str(user_input.best_path_width), 'stroke':wcolor, 'stroke-linecap':'round'})
+		for x1, y1, x2, y2 in pieces:
+			xtree.SubElement(svg_g, 'line', {'x1':str(x1), 'y1':str(y1), 'x2':str(x2), 'y2':str(y2)})
+		if circle:
+			xtree.SubElement(svg_g, 'circle', {'cx':str(circle[0]), 'cy':str(circle[1]), 'r':str(user_input.best_path_width), 'fill':wcolor, 'stroke':'none'})
+
+	return svg2png(bytestring=xtree.tostring(svg, encoding='unicode'), output_width=width, output_height=height)
+
+
+def tile_source(user_input, data, width, tile_size):
+	"""Returns a function which selects the maze elements of a Deep Zoom tile for macuahuitl.tile_pyramid().
+
+	Only the grid cells around a tile are looked at, and the pieces of the best path are sorted into
+	the tiles they touch beforehand, so the work and data for a tile are bound by the tile size.
+	"""
+	rows   = data['rows']
+	zoom   = width / data['vbw']
+	scale  = user_input.scale
+	frame  = user_input.frame
+	margin = scale * (abs(user_input.schotter_offset) + 0.75) + user_input.stroke_width  # reach of a line beyond its cell
+	wcolor = None
+	circle = None
+	pieces = {}
+
+	if data['bestwalker']:
+		wcolor = hls_to_hex(data['chaos'].uniform(0, 360), 0.5, 0.8)
+		circle = data['circle_pos']
+		reach  = user_input.best_path_width * 2.0
+		for piece in best_path_pieces(data['bestwalker']):
+			c1 = int(max(0, (min(piece[0], piece[2]) - reach) * zoom) // tile_size)
+			c2 = int(max(0, (max(piece[0], piece[2]) + reach) * zoom) // tile_size)
+			r1 = int(max(0, (min(piece[1], piece[3]) - reach) * zoom) // tile_size)
+			r2 = int(max(0, (max(piece[1], piece[3]) + reach) * zoom) // tile_size)
+			for row in range(r1, r2 + 1):
+				for col in range(c1, c2 + 1):
+					pieces.setdefault((col, row), []).append(piece)
+
+	def _tiles(left, top, w, h):
+		box = (left / zoom, top / zoom, w / zoom, h / zoom)
+		x1  = max(0, math.floor((box[0] - margin - frame) / scale))
+		x2  = max(0, math.ceil((box[0] + box[2] + margin - frame) / scale))
+		y1  = max(0, math.floor((box[1] - margin - frame) / scale))
+		y2  = max(0, math.ceil((box[1] + box[3] + margin - frame) / scale))
+		lines = [(e.x1, e.y1, e.x2, e.y2, e.hue) for row in rows[y1:y2] for e in row[x1:x2]]
+		tile_circle = circle if circle and (box[0] - margin <= circle[0] <= box[0] + box[2] + margin) and (box[1] - margin <= circle[1] <= box[1] + box[3] + margin) else None
+		return render_tile, (user_input, box, lines, (pieces.get((left // tile_size, top // tile_size), []), tile_circle, wcolor), (w, h))
+
+	return _tiles
+
+
+def main():
+	"""It's not just a single line of code, but what can we do? :)"""
+
+	user_input    = parse_arguments()
+
+	from macuahuitl import check_limits
+	check_limits(user_input, estimate_cost)
+	if user_input.stroke_stats:
+		print(json.dumps(stroke_statistics(user_input)))
+		return
+
+	from macuahuitl import generated_data
+	data = generated_data('temo', user_input, geometry_parameters, generate_data)
+
+	if user_input.export:
+		from macuahuitl import write_columns
+		elements = [element for row in data['rows'] for element in row]
+		write_columns(os.path.realpath(os.path.expanduser(user_input.export)), 'temo', [
+			('slope', 'B', (element.slope.value for element in elements)),
+			('hue',   'd', (element.hue for element in elements)),
+			('x1',    'd', (element.x1 for element in elements)),
+			('y1',    'd', (element.y1 for element in elements)),
+			('x2',    'd', (element.x2 for element in elements)),
+			('y2',    'd', (element.y2 for element in elements)),
+		], {
+			'columns':    len(data['rows'][0]) if data['rows'] else 0,
+			'rows':       len(data['rows']),
+			'scale':      user_input.scale,
+			'slopes':     {s.name.lower():s.value for s in Slope},
+			'order':      'row-major',
+			'width':      data['vbw'],
+			'height':     data['vbh'],
+			'best_path':  ''.join(data['bestwalker']) if data['bestwalker'] else None,
+		})
+		if not user_input.output:
+			return
+
+	if user_input.deep_zoom:
 		try:
-			import os
-			from cairosvg import svg2png
-			svg2png(
-				bytestring    = rawxml,
-				write_to      = os.path.realpath(os.path.expanduser(user_input.output)),
-				output_width  = user_input.output_size,
-				output_height = int(user_input.output_size * vbh / vbw) if user_input.output_size is not None else None
-			)
+			from macuahuitl import tile_pyramid
+			width = user_input.output_size[0] if user_input.output_size else data['vbw']
+			tile_pyramid(os.path.realpath(os.path.expanduser(user_input.deep_zoom)), width, max(1, int(width * data['vbh'] / data['vbw'])),
+				tile_source(user_input, data, width, user_input.tile_size), tile_size=user_input.tile_size, jobs=user_input.jobs)
 		except ImportError as e:
-			print('Couldn\'t rasterize nor write a PNG file. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+			print('Couldn\'t write the Deep Zoom image. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+		return
+
+	if user_input.plotter:
+		svg, vbw, vbh, travel = generate_plotter(user_input, data)
+		print('Pen-up travel: {:.1f} in row-major order of the lines, {:.1f} ordered ({:.1%}).'.format(travel[0], travel[1],
+			travel[1] / travel[0] if travel[0] else 1.0), file=sys.stderr)
+	else:
+		svg, vbw, vbh = generate(user_input, data)
+	rawxml        = xtree.tostring(svg, encoding='unicode')
+
+	# Output…
+	#
+	from macuahuitl import write_output
+	write_output(rawxml, user_input, vbw, vbh)
 
 
 if __name__ == '__main__':
@@ -26,11 +26,13 @@ import random
 import argparse
 import sys
 import xml.etree.ElementTree as xtree
-from collections import Counter
+from collections import Counter, deque
 
 __author__  = 'Christian Rosentreter'
 __version__ = '1.4'
-__all__     = []
+__all__     = ['parse_arguments', 'generate_layout', 'generate_tiles', 'generate_data', 'generate', 'write_stream', 'geometry_parameters', 'estimate_cost']
+
+STYLE_OPTIONS = ('palette', 'stream', 'output', 'output_size', 'export', 'geometry_cache', 'dry_run', 'max_elements', 'max_seconds', 'max_output_bytes')  # no influence on the generated data
 
 
 
@@ -41,6 +43,43 @@ def triangular_stronger_bias(chaos, low, high, bias, iterations):
 	return chaos.choice(result_set)[0]
 
 
+def pick_tile_colors(chaos, colors, bias, iterations, *, left=None, top=None, tile=None):
+	"""Picks the background and accent shape color indices of a tile, avoiding the background colors of its left and top neighbors.
+
+	Returns both colors and the number of tries it took, each try draws 'iterations' random samples.
+	"""
+	tries = 0
+
+	#  Fetch background color
+	loop_cnt = 0
+	while loop_cnt < 100:
+		loop_cnt += 1
+		tile_color_bg = triangular_stronger_bias(chaos, 0, colors, bias, iterations)
+		if tile_color_bg is left:  # one to the left
+			continue
+		if tile_color_bg is top:   # one to the top
+			continue
+		break
+	else:
+		if tile:
+			print('Warning: Couldn\'t get a non-colliding tile background color for tile "{}", because the color bias is too high for the amount of available colors.'.format(tile), file=sys.stderr)
+	tries += loop_cnt
+
+	#  Fetch foreground color
+	loop_cnt = 0
+	while loop_cnt < 100:
+		loop_cnt += 1
+		tile_color_shape = triangular_stronger_bias(chaos, 0, colors, bias, iterations)
+		if tile_color_shape is not tile_color_bg:
+			break
+	else:
+		if tile:
+			print('Warning: Couldn\'t get a non-colliding accent shape color for tile "{}", because the color bias is too high for the amount of available colors.'.format(tile), file=sys.stderr)
+	tries += loop_cnt
+
+	return tile_color_bg, tile_color_shape, tries
+
+
 def color_to_hex(color):
 	"""Converts a color tuple (r,g,b) into a SVG compatible hexadecimal color descriptor."""
 	return '#{:02x}{:02x}{:02x}'.format(*color)
@@ -52,101 +91,102 @@ def float_to_svg(v):
 
 
 
-def main():
-	"""Yet another grid generator… and it probably won't be the last one either. :) """
-
-	palettes = {
-		'shadowplay': [   # Bridget Riley: "Shadowplay"
-			( 61,  85, 119),
-			( 48, 102, 208),
-			(  0, 141, 184),
-			(112, 179, 113),
-			(232,  98, 131),
-			(112, 169, 236),
-			(162, 124, 171),
-			(197, 141, 211),
-			(255, 164,  82),
-			(248, 221, 143),
-			(255, 224, 230),
-		],
-		'spectrum9': [   # Ellsworth Kelly: "Spectrum Ⅸ"
-			(238, 225,  58),
-			(143, 220,  67),
-			(104, 209, 120),
-			( 42, 176, 186),
-			( 48, 138, 214),
-			( 97, 114, 197),
-			(116,  95, 166),
-			(138, 102, 152),
-			(206, 105, 120),
-			(241, 103 , 98),
-			(250, 139,   0),
-			(250, 196,  64),
-		],
-		'binary': [
-			(  0,   0,   0),
-			(255, 255, 255),
-		],
-		'greyscale': [
-			(   0,    0,    0),
-			(0x11, 0x11, 0x11),
-			(0x22, 0x22, 0x22),
-			(0x33, 0x33, 0x33),
-			(0x44, 0x44, 0x44),
-			(0x55, 0x55, 0x55),
-			(0x66, 0x66, 0x66),
-			(0x77, 0x77, 0x77),
-			(0x88, 0x88, 0x88),
-			(0x99, 0x99, 0x99),
-			(0xAA, 0xAA, 0xAA),
-			(0xBB, 0xBB, 0xBB),
-			(0xCC, 0xCC, 0xCC),
-			(0xDD, 0xDD, 0xDD),
-			( 255,  255,  255),
-		],
-		'rgb': [
-			(255,   0,   0),
-			(  0, 255,   0),
-			(  0,   0, 255),
-		],
-		'yell': [  # Unknown Artist: "Yell" (NHK asadora) marketing
-			(0x00, 0x00, 0x00),
-			(0x05, 0xae, 0xb0),
-			(0xeb, 0x55, 0x75),
-			(0xef, 0xba, 0x1f),
-			(0xff, 0xff, 0xff),
-		],
-		'owinja': [  # Carla Thompson: "Turquoise & Orange Star Quilt"
-			(195, 216, 227),
-			(148, 209, 225),
-			(  0, 141, 171),
-			(162,  37,  23),
-			(231, 105,  83),
-			(252, 117,  21),	
-		],
-		'folklore': [  # Victor Vasarely: "Planetary Folklore Participations N° 1" (selection)
-			(187, 248, 249),
-			(252, 252,   4),
-			(105, 222, 249),
-			(252, 207,  10),
-			(250, 126, 250),
-			( 35, 249,  66),
-			(  4, 159, 242),
-			(251, 117,  13),
-			( 15, 114, 214),
-			(  6, 187,  82),
-			(252,  62,   4),
-			( 36, 112, 178),
-			(206,  76, 113),
-			(105,  58, 162),
-			( 10, 131,  51),
-			(135,  27,  65),
-			( 57,  34, 114),
-			( 17,  33,  13),
-		],
-		# TODO: implement "original" special selection mode (separate array)
-	}
-
+PALETTES = {
+	'shadowplay': (   # Bridget Riley: "Shadowplay"
+		( 61,  85, 119),
+		( 48, 102, 208),
+		(  0, 141, 184),
+		(112, 179, 113),
+		(232,  98, 131),
+		(112, 169, 236),
+		(162, 124, 171),
+		(197, 141, 211),
+		(255, 164,  82),
+		(248, 221, 143),
+		(255, 224, 230),
+	),
+	'spectrum9': (   # Ellsworth Kelly: "Spectrum Ⅸ"
+		(238, 225,  58),
+		(143, 220,  67),
+		(104, 209, 120),
+		( 42, 176, 186),
+		( 48, 138, 214),
+		( 97, 114, 197),
+		(116,  95, 166),
+		(138, 102, 152),
+		(206, 105, 120),
+		(241, 103 , 98),
+		(250, 139,   0),
+		(250, 196,  64),
+	),
+	'binary': (
+		(  0,   0,   0),
+		(255, 255, 255),
+	),
+	'greyscale': (
+		(   0,    0,    0),
+		(0x11, 0x11, 0x11),
+		(0x22, 0x22, 0x22),
+		(0x33, 0x33, 0x33),
+		(0x44, 0x44, 0x44),
+		(0x55, 0x55, 0x55),
+		(0x66, 0x66, 0x66),
+		(0x77, 0x77, 0x77),
+		(0x88, 0x88, 0x88),
+		(0x99, 0x99, 0x99),
+		(0xAA, 0xAA, 0xAA),
+		(0xBB, 0xBB, 0xBB),
+		(0xCC, 0xCC, 0xCC),
+		(0xDD, 0xDD, 0xDD),
+		( 255,  255,  255),
+	),
+	'rgb': (
+		(255,   0,   0),
+		(  0, 255,   0),
+		(  0,   0, 255),
+	),
+	'yell': (  # Unknown Artist: "Yell" (NHK asadora) marketing
+		(0x00, 0x00, 0x00),
+		(0x05, 0xae, 0xb0),
+		(0xeb, 0x55, 0x75),
+		(0xef, 0xba, 0x1f),
+		(0xff, 0xff, 0xff),
+	),
+	'owinja': (  # Carla Thompson: "Turquoise & Orange Star Quilt"
+		(195, 216, 227),
+		(148, 209, 225),
+		(  0, 141, 171),
+		(162,  37,  23),
+		(231, 105,  83),
+		(252, 117,  21),	
+	),
+	'folklore': (  # Victor Vasarely: "Planetary Folklore Participations N° 1" (selection)
+		(187, 248, 249),
+		(252, 252,   4),
+		(105, 222, 249),
+		(252, 207,  10),
+		(250, 126, 250),
+		( 35, 249,  66),
+		(  4, 159, 242),
+		(251, 117,  13),
+		( 15, 114, 214),
+		(  6, 187,  82),
+		(252,  62,   4),
+		( 36, 112, 178),
+		(206,  76, 113),
+		(105,  58, 162),
+		( 10, 131,  51),
+		(135,  27,  65),
+		( 57,  34, 114),
+		( 17,  33,  13),
+	),
+	# TODO: implement "original" special selection mode (separate array)
+}
+
+
+
+def parse_arguments(args=None):
+	"""Sets up the command line interface and parses the supplied arguments."""
 
 	ap = argparse.ArgumentParser(
 		description=('Creates a grid of colored squares that are accentuated with smaller squares '
@@ -170,27 +210,97 @@ def main():
 	g.add_argument('--color-bias',         metavar='INT',      type=int,   help='increase amount of directional bias when choosing random colors  [:1]', default=1)
 	g.add_argument('--scale',              metavar='INT',      type=int,   help='base scale factor of the grid elements  [:74.0]', default=74.0)
 	g.add_argument('--padding',            metavar='FLOAT',    type=float, help='manually force inner padding to control the frame around the accent shapes')
-	g.add_argument('--palette',            choices=list(palettes.keys()),  help='choose random colors from the specified color scheme  [:default]', default='folklore')
+	g.add_argument('--palette',            choices=list(PALETTES.keys()),  help='choose random colors from the specified color scheme  [:default]', default='folklore')
 	g.add_argument('--random-seed',        metavar='INT',      type=int,   help='fixed initialization of the random number generator for predictable results')
 	g.add_argument('--randomize',          action='store_true',            help='generate truly random layouts; other algorithm values provided via command line parameters are utilized as limits')
 
 	g = ap.add_argument_group('Output')
 	g.add_argument('-o', '--output',       metavar='FILENAME', type=str,   help='optionally rasterize the generated vector paths and write the result into a PNG file (requires the `svgcairo\' Python module)')
-	g.add_argument('--output-size',        metavar='INT',      type=int,   help='force pixel width of the raster image, height is automatically calculated; if omitted the generated SVG viewbox dimensions are used')
+	g.add_argument('--output-size',        metavar='INT',      type=int,   nargs='+', help='force pixel width of the raster image, height is automatically calculated; if omitted the generated SVG viewbox dimensions are used; passing several sizes writes one PNG file for each, the `{size}\' placeholder in the filename is replaced with the size (else it is appended to the filename)')
+	g.add_argument('--preview',            metavar='INT',      type=int,   nargs='?', const=24, help='quickly generate just the top left corner of INT×INT tiles, laid out exactly as in the full artwork  [:24]')
+	g.add_argument('--stream',             action='store_true',            help='print the SVG output tile by tile while generating, keeping just one row of tiles in memory; for huge grids that don\'t fit into memory otherwise (not available for PNG output, export, and the geometry cache)')
+	g.add_argument('--export',             metavar='FILENAME', type=str,   help='write the generated shape data as typed columnar arrays into a binary file instead of printing SVG output')
+	g.add_argument('--geometry-cache',     metavar='DIR',      type=str,   help='reuse the generated layout of earlier runs with the same random seed and algorithm parameters from a cache directory, so changes of style only options are applied without generating everything again; requires --random-seed')
 
-	user_input = ap.parse_args()
+	from macuahuitl import add_limit_arguments
+	add_limit_arguments(ap)
 
+	return ap.parse_args(args)
 
-	# Generate data/ SVG…
-	#
-	chaos      = random.Random(user_input.random_seed)
+
+def geometry_parameters(user_input):
+	"""Returns the parts of the parsed user input with influence on the generated data, f.ex. to use as cache key."""
+	parameters = {k:v for k, v in vars(user_input).items() if k not in STYLE_OPTIONS}
+	if not user_input.randomize:
+		parameters['colors'] = len(PALETTES[user_input.palette])  # palettes with the same amount of colors share their layouts
+	parameters['version'] = __version__
+	return parameters
+
+
+def estimate_cost(user_input):
+	"""Estimates the number of shape elements, run time, and output size for the parsed user input; nothing is generated.
+
+	Run time and size per tile were measured with the default parameters. The random samples drawn to
+	pick the tile colors are probed on the first tiles of the grid, as they depend heavily on the color
+	bias and the amount of colors. Random layouts are estimated with their upper limits.
+	"""
+	tile_size  = max(1, user_input.scale)
+	tiles_x    = max(1, user_input.columns)
+	tiles_y    = max(1, user_input.rows)
+	colors     = len(PALETTES[user_input.palette])
+	color_iter = max(1, user_input.color_bias)
+
+	if user_input.randomize:
+		tiles_x = tiles_y = tiles_x + (tiles_x % 2)
+		colors  = min(len(p) for p in PALETTES.values())
+
+	vbw   = tile_size * tiles_x
+	vbh   = tile_size * tiles_y
+	tiles = tiles_x * tiles_y
+	drawn = tiles
+	if user_input.preview:
+		tiles = min(tiles_x, user_input.preview) * min(tiles_y, user_input.preview)
+		drawn = min(tiles_y, user_input.preview) * tiles_x
+
+	# probe a limited number of samples; if a single tile may exceed them assume the worst
+	if color_iter * 200 > 20000:
+		tries = 200
+	else:
+		chaos   = random.Random(user_input.random_seed)
+		probed  = []
+		samples = 0
+		for y in range(0, tiles_y):
+			for x in range(0, tiles_x):
+				left = probed[-1][0] if x > 0 else None
+				top  = probed[-tiles_x][0] if y > 0 else None
+				probed.append(pick_tile_colors(chaos, colors, x / tiles_x * colors, color_iter, left=left, top=top))
+				samples += probed[-1][2] * color_iter
+				if samples >= 20000:
+					break
+			else:
+				continue
+			break
+		tries = sum(p[2] for p in probed) / len(probed)
+
+	svg_bytes = tiles * 154
+
+	return {
+		'elements':     tiles * 2 + 1,
+		'samples':      int(drawn * tries * color_iter),
+		'seconds':      round(tiles * 50e-6 + drawn * tries * (1.5e-6 + color_iter * 0.6e-6), 3),
+		'output_bytes': sum(w * max(1, int(w * vbh / vbw)) * 4 for w in (user_input.output_size or [vbw])) if user_input.output else int(svg_bytes),
+	}
+
+
+def generate_layout(user_input, chaos):
+	"""Sets up (or with `--randomize' draws) the grid, palette, and accent shape rules of the artwork from the parsed user input."""
 
 	tile_size  = max(1, user_input.scale)
 	tiles_x    = max(1, user_input.columns)
 	tiles_y    = max(1, user_input.rows)
 	tiles_ioff = user_input.inset_offset if user_input.inset_offset is not None else int(min(tiles_x, tiles_y)/2.0/2.0)
 	tile_frame = user_input.padding if user_input.padding is not None else round(0.14 * tile_size, 2)
-	palette    = palettes[user_input.palette] # if chaos.uniform(0, 1) < 0.5 else list(reversed(palettes[user_input.palette]))
+	pname      = user_input.palette
 	color_iter = max(1, user_input.color_bias)
 	flip_x     = False if user_input.no_horizontal_flip else True
 	flip_y     = False if user_input.no_vertical_flip else True
@@ -207,29 +317,54 @@ def main():
 		#
 		tiles_ioff = chaos.randrange(0, tiles_ioff + 1)
 		tile_frame = chaos.uniform(0, tile_frame)
-		palette    = palettes[chaos.choice(list(palettes.keys()))]
+		pname      = chaos.choice(list(PALETTES.keys()))
 		color_iter = int(max(1.0, triangular_stronger_bias(chaos, 0, color_iter, 0, 10)))
 		flip_x     = chaos.choice([0, 1])
 		flip_y     = chaos.choice([0, 1])
 		inset      = chaos.choice([0, 1])
 
-	if chaos.uniform(0, 1) < 0.5:
-		palette.reverse()
+	preverse   = chaos.uniform(0, 1) < 0.5
+	init_shape = chaos.choice([0, 1])  # 1 == square, 2 == circle
 
-	stile_size = tile_size - tile_frame - tile_frame
-	stile_rad  = stile_size / 2.0
-	vbw        = int(tile_size * tiles_x)
-	vbh        = int(tile_size * tiles_y)
-	colors     = len(palette)
+	return {
+		'tiles_x':    tiles_x,
+		'tiles_y':    tiles_y,
+		'tiles_ioff': tiles_ioff,
+		'tile_size':  tile_size,
+		'tile_frame': tile_frame,
+		'pname':      pname,
+		'preverse':   preverse,
+		'colors':     len(PALETTES[pname]),
+		'color_iter': color_iter,
+		'flip_x':     flip_x,
+		'flip_y':     flip_y,
+		'inset':      inset,
+		'init_shape': init_shape,
+		'view_x':     min(tiles_x, user_input.preview) if user_input.preview else tiles_x,
+		'view_y':     min(tiles_y, user_input.preview) if user_input.preview else tiles_y,
+	}
 
-	svg = xtree.Element('svg', {'width':'100%', 'height':'100%', 'xmlns':'http://www.w3.org/2000/svg', 'viewBox':'0 0 {} {}'.format(vbw, vbh)})
-	title = xtree.SubElement(svg, 'title')
-	title.text = 'A Teocuitlatl Artwork'
 
-	tile_backgrounds = []
-	init_shape = chaos.choice([0, 1])  # 1 == square, 2 == circle
+def generate_tiles(layout, chaos):
+	"""Yields the position, and the shape and palette color indices of the tiles, row by row.
+
+	The colors of a tile are only checked against the backgrounds of its left and top neighbors, so
+	just the backgrounds of the last row of tiles are kept, in a ring buffer. The rows of a preview
+	are generated completely, as the random numbers have to stay in sync.
+	"""
+	tiles_x    = layout['tiles_x']
+	tiles_y    = layout['tiles_y']
+	tiles_ioff = layout['tiles_ioff']
+	colors     = layout['colors']
+	color_iter = layout['color_iter']
+	flip_x     = layout['flip_x']
+	flip_y     = layout['flip_y']
+	inset      = layout['inset']
+	init_shape = layout['init_shape']
+
+	tile_backgrounds = deque(maxlen=tiles_x)
 
-	for y in range(0, tiles_y):
+	for y in range(0, layout['view_y']):
 		for x in range(0, tiles_x):
 
 			#  Select inner shape
@@ -247,77 +382,177 @@ def main():
 			if flip_x and (x >= (tiles_x / 2)):
 				shape = 1 - shape  # swap
 
-			#  Fetch background color
-			loop_cnt = 0
-			while loop_cnt < 100:
-				loop_cnt += 1
-				tile_color_bg = triangular_stronger_bias(chaos, 0, colors, bias, color_iter)
-				if (x > 0) and (tile_color_bg is tile_backgrounds[-1]):       # one to the left
-					continue
-				if (y > 0) and (tile_color_bg is tile_backgrounds[-tiles_x]): # one to the top
-					continue
-				break
-			else:
-				print('Warning: Couldn\'t get a non-colliding tile background color for tile "{}×{}", because the color bias is too high for the amount of available colors.'.format(x, y), file=sys.stderr)
+			tile_color_bg, tile_color_shape, _ = pick_tile_colors(chaos, colors, bias, color_iter,
+				left=tile_backgrounds[-1] if x > 0 else None, top=tile_backgrounds[0] if y > 0 else None, tile='{}×{}'.format(x, y))
 			tile_backgrounds.append(tile_color_bg)
 
-			#  Fetch foreground color
-			loop_cnt = 0
-			while loop_cnt < 100:
-				loop_cnt += 1
-				tile_color_shape = triangular_stronger_bias(chaos, 0, colors, bias, color_iter)
-				if tile_color_shape is not tile_color_bg:
-					break
-			else:
-				print('Warning: Couldn\'t get a non-colliding accent shape color for tile "{}×{}", because the color bias is too high for the amount of available colors.'.format(x, y), file=sys.stderr)
-
-			#  Output the tile
-			svg_tile_group = xtree.SubElement(svg, 'g', {'id': 'tile_{}x{}'.format(x+1, y+1)})
-
-			xtree.SubElement(svg_tile_group, 'rect', {
-				'x':      float_to_svg(x * tile_size),
-				'y':      float_to_svg(y * tile_size),
-				# Note: overlap to avoid potential hairlines between the tiles in some SVG renderers
-				'width':  float_to_svg(tile_size * (2 if ((x + 1) < tiles_x) else 1)),
-				'height': float_to_svg(tile_size * (2 if ((y + 1) < tiles_y) else 1)),
-				'fill':   color_to_hex(palette[tile_color_bg])
-			})
-
-			if shape == 0:
-				xtree.SubElement(svg_tile_group, 'rect', {
-					'x':      float_to_svg((x * tile_size) + tile_frame),
-					'y':      float_to_svg((y * tile_size) + tile_frame),
-					'width':  float_to_svg(stile_size),
-					'height': float_to_svg(stile_size),
-					'fill':   color_to_hex(palette[tile_color_shape])
-				})
-			else:
-				xtree.SubElement(svg_tile_group, 'circle', {
-					'cx':     float_to_svg((x * tile_size) + (tile_size / 2)),
-					'cy':     float_to_svg((y * tile_size) + (tile_size / 2)),
-					'r':      float_to_svg(stile_rad),
-					'fill':   color_to_hex(palette[tile_color_shape])
-				})
+			yield x, y, (shape, tile_color_bg, tile_color_shape)
+
+
+def generate_data(user_input):
+	"""Generates the shapes and palette color indices of the tiles from the parsed user input."""
+
+	chaos  = random.Random(user_input.random_seed)
+	layout = generate_layout(user_input, chaos)
+
+	return {
+		'tiles':      [tile for x, _, tile in generate_tiles(layout, chaos) if x < layout['view_x']],
+		'tiles_x':    layout['view_x'],
+		'tiles_y':    layout['view_y'],
+		'tile_size':  layout['tile_size'],
+		'tile_frame': layout['tile_frame'],
+		'pname':      layout['pname'],
+		'preverse':   layout['preverse'],
+		'vbw':        int(layout['tile_size'] * layout['view_x']),
+		'vbh':        int(layout['tile_size'] * layout['view_y']),
+	}
+
+
+def data_palette(user_input, data):
+	"""Returns the colors for the palette indices of generated data.
+
+	Palettes are a matter of style: data generated for another palette with the same amount of colors
+	(f.ex. from the geometry cache) maps its color indices directly onto the chosen one.
+	"""
+	palette = list(PALETTES[data['pname'] if user_input.randomize else user_input.palette])
+	if data['preverse']:
+		palette.reverse()
+	return palette
+
+
+def svg_root(vbw, vbh):
+	"""Returns the SVG root element of an artwork with the given viewbox size."""
+	svg = xtree.Element('svg', {'width':'100%', 'height':'100%', 'xmlns':'http://www.w3.org/2000/svg', 'viewBox':'0 0 {} {}'.format(vbw, vbh)})
+	title = xtree.SubElement(svg, 'title')
+	title.text = 'A Teocuitlatl Artwork'
+	return svg
+
+
+def tile_group(x, y, tile, tiles_x, tiles_y, *, tile_size, tile_frame, palette):
+	"""Returns the SVG group element of the tile at the given position."""
+	shape, tile_color_bg, tile_color_shape = tile
+	stile_size = tile_size - tile_frame - tile_frame
+	stile_rad  = stile_size / 2.0
+
+	svg_tile_group = xtree.Element('g', {'id': 'tile_{}x{}'.format(x+1, y+1)})
+
+	xtree.SubElement(svg_tile_group, 'rect', {
+		'x':      float_to_svg(x * tile_size),
+		'y':      float_to_svg(y * tile_size),
+		# Note: overlap to avoid potential hairlines between the tiles in some SVG renderers
+		'width':  float_to_svg(tile_size * (2 if ((x + 1) < tiles_x) else 1)),
+		'height': float_to_svg(tile_size * (2 if ((y + 1) < tiles_y) else 1)),
+		'fill':   color_to_hex(palette[tile_color_bg])
+	})
+
+	if shape == 0:
+		xtree.SubElement(svg_tile_group, 'rect', {
+			'x':      float_to_svg((x * tile_size) + tile_frame),
+			'y':      float_to_svg((y * tile_size) + tile_frame),
+			'width':  float_to_svg(stile_size),
+			'height': float_to_svg(stile_size),
+			'fill':   color_to_hex(palette[tile_color_shape])
+		})
+	else:
+		xtree.SubElement(svg_tile_group, 'circle', {
+			'cx':     float_to_svg((x * tile_size) + (tile_size / 2)),
+			'cy':     float_to_svg((y * tile_size) + (tile_size / 2)),
+			'r':      float_to_svg(stile_rad),
+			'fill':   color_to_hex(palette[tile_color_shape])
+		})
+
+	return svg_tile_group
+
+
+def generate(user_input, data=None):
+	"""Generates the tiles from the parsed user input, or from already generated data; returns the SVG root element and its viewbox size."""
+
+	if data is None:
+		data = generate_data(user_input)
+
+	tiles_x    = data['tiles_x']
+	tiles_y    = data['tiles_y']
+	tile_size  = data['tile_size']
+	tile_frame = data['tile_frame']
+	vbw        = data['vbw']
+	vbh        = data['vbh']
+	palette    = data_palette(user_input, data)
+
+	# Generate SVG…
+	#
+	svg = svg_root(vbw, vbh)
+
+	for tid, tile in enumerate(data['tiles']):
+		y, x = divmod(tid, tiles_x)
+		svg.append(tile_group(x, y, tile, tiles_x, tiles_y, tile_size=tile_size, tile_frame=tile_frame, palette=palette))
 
-	rawxml = xtree.tostring(svg, encoding='unicode')
+	return svg, vbw, vbh
+
+
+def write_stream(user_input, out):
+	"""Generates the tiles from the parsed user input and writes the SVG data of each one as soon as it is decided.
+
+	Memory use is bound by the number of columns rather than by the number of tiles, as neither the
+	generated data nor the SVG tree of the tiles is kept. The output is the same as for generate().
+	"""
+	chaos   = random.Random(user_input.random_seed)
+	layout  = generate_layout(user_input, chaos)
+	view_x  = layout['view_x']
+	view_y  = layout['view_y']
+	palette = data_palette(user_input, layout)
+
+	head = xtree.tostring(svg_root(int(layout['tile_size'] * view_x), int(layout['tile_size'] * view_y)), encoding='unicode')
+	out.write(head[:-len('</svg>')])
+	for x, y, tile in generate_tiles(layout, chaos):
+		if x < view_x:
+			out.write(xtree.tostring(tile_group(x, y, tile, view_x, view_y, tile_size=layout['tile_size'], tile_frame=layout['tile_frame'], palette=palette), encoding='unicode'))
+	out.write('</svg>\n')
+
+
+def main():
+	"""Yet another grid generator… and it probably won't be the last one either. :) """
+
+	user_input    = parse_arguments()
+
+	from macuahuitl import check_limits
+	check_limits(user_input, estimate_cost)
+
+	if user_input.stream:
+		if not (user_input.output or user_input.export or user_input.geometry_cache):
+			write_stream(user_input, sys.stdout)
+			return
+		print('Warning: Streaming (`--stream\') is only available for SVG output, ignoring it.', file=sys.stderr)
+
+	from macuahuitl import generated_data
+	data = generated_data('teocuitlatl', user_input, geometry_parameters, generate_data)
+
+	if user_input.export:
+		import os
+		from macuahuitl import write_columns
+		write_columns(os.path.realpath(os.path.expanduser(user_input.export)), 'teocuitlatl', [
+			('shape',      'B', (t[0] for t in data['tiles'])),
+			('background', 'B', (t[1] for t in data['tiles'])),
+			('accent',     'B', (t[2] for t in data['tiles'])),
+		], {
+			'columns':    data['tiles_x'],
+			'rows':       data['tiles_y'],
+			'tile_size':  data['tile_size'],
+			'tile_frame': data['tile_frame'],
+			'shapes':     {'square':0, 'circle':1},
+			'palette':    [color_to_hex(c) for c in data_palette(user_input, data)],
+			'order':      'row-major',
+		})
+		if not user_input.output:
+			return
+
+	svg, vbw, vbh = generate(user_input, data)
+	rawxml        = xtree.tostring(svg, encoding='unicode')
 
 
 	# Output…
 	#
-	if not user_input.output:
-		print(rawxml)
-	else:
-		try:
-			import os
-			from cairosvg import svg2png
-			svg2png(
-				bytestring    = rawxml,
-				write_to      = os.path.realpath(os.path.expanduser(user_input.output)),
-				output_width  = user_input.output_size,
-				output_height = int(user_input.output_size * vbh / vbw) if user_input.output_size is not None else None
-			)
-		except ImportError as e:
-			print('Couldn\'t rasterize nor write a PNG file. Required Python module \'cairosvg\' is not available: {}'.format(str(e)), file=sys.stderr)
+	from macuahuitl import write_output
+	write_output(rawxml, user_input, vbw, vbh)
 
 
 